@@ -0,0 +1,248 @@
+#!/usr/bin/env python
+
+"""Stub Appium server that speaks enough of the W3C WebDriver protocol for automation_manager.
+
+Each FakeAppiumServer stands in for one "appium -p PORT" process and its
+emulator. Latencies and page fixtures are configurable so scheduler and wait
+changes can be measured without real devices.
+"""
+
+import base64
+import itertools
+import json
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ELEMENT_KEY = 'element-6066-11e4-a52e-4f735466cecf'
+
+# 1x1 transparent PNG returned for screenshots
+PNG_PIXEL = base64.b64encode(bytes.fromhex(
+    '89504e470d0a1a0a0000000d49484452000000010000000108060000001f15c489'
+    '0000000d4944415478da63f8ffff3f0005fe02fea7d6a5b10000000049454e44ae426082'
+)).decode()
+
+DEFAULT_FIXTURE = {
+    # Latencies in milliseconds
+    'command_ms': 5,
+    'session_ms': 200,
+    'source_ms': 20,
+    # Locator substrings that never match, e.g. to force a fallback
+    'missing_locators': [],
+    # Candidate index the selector-set race reports, -1 for "already done", null for no match
+    'race_index': 0,
+    'screen': {'width': 1080, 'height': 2340},
+    'web_source': '<html><body><div>Welcome</div><button>Open</button></body></html>',
+    'native_source': (
+        '<?xml version="1.0" encoding="UTF-8"?><hierarchy rotation="0">'
+        '<android.widget.FrameLayout text="" resource-id="android:id/content">'
+        '<android.widget.Button text="Accept" resource-id="com.example:id/accept"/>'
+        '</android.widget.FrameLayout></hierarchy>'
+    ),
+}
+
+class FakeSession:
+    def __init__(self, capabilities):
+        self.id = uuid.uuid4().hex
+        self.capabilities = capabilities
+        self.context = 'NATIVE_APP'
+        self.url = 'about:blank'
+        self.app_states = {}
+        # The clicked button is gone until the next navigation
+        self.clicked = False
+        self.elements = itertools.count(1)
+
+class FakeAppiumServer:
+    """One fake Appium endpoint on its own port, serving in a background thread."""
+
+    def __init__(self, port, fixture=None):
+        self.port = port
+        self.fixture = dict(DEFAULT_FIXTURE, **(fixture or {}))
+        self.sessions = {}
+        self.commands = 0
+        self.sessions_created = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, value, status=200):
+                body = json.dumps({'value': value}).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _handle(self, method):
+                length = int(self.headers.get('Content-Length') or 0)
+                payload = json.loads(self.rfile.read(length) or b'{}') if length else {}
+                try:
+                    status, value = server.dispatch(method, self.path, payload)
+                except Exception as e:
+                    status, value = 500, {'error': 'unknown error', 'message': str(e)}
+                self._reply(value, status)
+
+            def do_GET(self):
+                self._handle('GET')
+
+            def do_POST(self):
+                self._handle('POST')
+
+            def do_DELETE(self):
+                self._handle('DELETE')
+
+        return Handler
+
+    def _latency(self, key):
+        time.sleep(self.fixture[key] / 1000.0)
+
+    def _element(self, session):
+        return {ELEMENT_KEY: f'{session.id[:8]}-{next(session.elements)}'}
+
+    def _missing(self, value):
+        return any(part in str(value) for part in self.fixture['missing_locators'])
+
+    def dispatch(self, method, path, payload):
+        with self._lock:
+            self.commands += 1
+
+        if path == '/status':
+            return 200, {'ready': True, 'message': 'fake appium'}
+
+        if path == '/session' and method == 'POST':
+            self._latency('session_ms')
+            capabilities = payload.get('capabilities', {}).get('alwaysMatch', {})
+            session = FakeSession(capabilities)
+            with self._lock:
+                self.sessions[session.id] = session
+                self.sessions_created += 1
+            return 200, {'sessionId': session.id, 'capabilities': dict(capabilities, platformName='Android')}
+
+        match = re.match(r'^/session/([^/]+)(/.*)?$', path)
+        if not match or match.group(1) not in self.sessions:
+            return 404, {'error': 'invalid session id', 'message': 'No such session'}
+        session = self.sessions[match.group(1)]
+        route = match.group(2) or ''
+
+        if route == '' and method == 'DELETE':
+            with self._lock:
+                self.sessions.pop(session.id, None)
+            return 200, None
+
+        if route == '/source':
+            self._latency('source_ms')
+            web = session.context != 'NATIVE_APP'
+            return 200, self.fixture['web_source' if web else 'native_source']
+
+        self._latency('command_ms')
+
+        if route == '/contexts':
+            return 200, ['NATIVE_APP', 'CHROMIUM']
+        if route == '/context':
+            if method == 'POST':
+                session.context = payload.get('name', 'NATIVE_APP')
+                return 200, None
+            return 200, session.context
+        if route == '/url':
+            if method == 'POST':
+                session.url = payload.get('url', session.url)
+                session.clicked = False
+                return 200, None
+            return 200, session.url
+        if route in ('/element', '/elements'):
+            if self._missing(payload.get('value')) or (route == '/elements' and session.clicked):
+                if route == '/element':
+                    return 404, {'error': 'no such element', 'message': 'not found'}
+                return 200, []
+            element = self._element(session)
+            return 200, element if route == '/element' else [element]
+        if re.match(r'^/element/[^/]+/(displayed|enabled)$', route):
+            return 200, True
+        if re.match(r'^/element/[^/]+/click$', route):
+            # Every click navigates, which is what the login waits look for
+            session.url = f"{session.url.split('#')[0]}#{uuid.uuid4().hex[:6]}"
+            session.clicked = True
+            return 200, None
+        if re.match(r'^/element/[^/]+/(clear|value)$', route):
+            return 200, None
+        if route == '/execute/sync':
+            return 200, self._execute(session, payload.get('script', ''), payload.get('args', []))
+        if route in ('/actions', '/back'):
+            return 200, None
+        if route == '/window/rect':
+            screen = self.fixture['screen']
+            return 200, {'x': 0, 'y': 0, 'width': screen['width'], 'height': screen['height']}
+        if route == '/screenshot':
+            return 200, PNG_PIXEL
+        return 404, {'error': 'unknown command', 'message': f'{method} {route} not stubbed'}
+
+    def _execute(self, session, script, args):
+        if script.startswith('mobile:'):
+            command = script.split(':', 1)[1].strip()
+            params = args[0] if args else {}
+            package = params.get('appId') or params.get('bundleId') or params.get('appPackage')
+            if command == 'activateApp':
+                session.app_states = {package: 4}
+                session.clicked = False
+                return None
+            if command == 'terminateApp':
+                session.app_states[package] = 1
+                return True
+            if command == 'queryAppState':
+                return session.app_states.get(package, 1)
+            if command == 'isAppInstalled':
+                return True
+            if command == 'getCurrentActivity':
+                return '.MainActivity'
+            if command == 'getCurrentPackage':
+                return next(iter(session.app_states), '')
+            return None
+        if 'document.readyState' in script:
+            return 'complete'
+        if 'XPathResult' in script:
+            index = self.fixture['race_index']
+            if index is None:
+                return None
+            if index < 0:
+                return [-1, None]
+            return [index, self._element(session)]
+        return None
+
+def start_fake_servers(count, base_port, fixture=None):
+    """Starts count fake servers on consecutive ports."""
+    return [FakeAppiumServer(base_port + i, fixture).start() for i in range(count)]
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="Run fake Appium servers until interrupted")
+    parser.add_argument('--count', type=int, default=1)
+    parser.add_argument('--base-port', type=int, default=4723)
+    parser.add_argument('--fixture', help="JSON file overriding DEFAULT_FIXTURE")
+    args = parser.parse_args()
+    fixture = json.load(open(args.fixture)) if args.fixture else None
+    servers = start_fake_servers(args.count, args.base_port, fixture)
+    print(f"Fake Appium servers on ports {args.base_port}-{args.base_port + args.count - 1}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        for server in servers:
+            server.stop()
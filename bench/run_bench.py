@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+
+"""Drives main.main end to end against fake Appium servers and reports throughput.
+
+Example:
+    python bench/run_bench.py --rows 1000 --devices 20 --engine asyncio
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from bench.fake_appium import start_fake_servers  # noqa: E402
+from src.checkpoint import Checkpoint  # noqa: E402
+from src.report_generator import percentile  # noqa: E402
+
+def write_inputs(workdir, args):
+    accounts_file = os.path.join(workdir, 'accounts.csv')
+    with open(accounts_file, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['email', 'password', 'group_link', 'beta_link'])
+        for i in range(args.rows):
+            writer.writerow([
+                f'bench{i}@example.com', 'secret',
+                'https://groups.google.com/g/bench',
+                'https://play.google.com/apps/testing/com.example.app',
+            ])
+
+    config = {
+        'accounts_file': accounts_file,
+        'wait_minutes': args.wait_minutes,
+        'engine': args.engine,
+        'async_threads': args.async_threads,
+        'max_threads': args.max_threads,
+        'parallel_workers': [
+            {'device_id': f'emulator-{5554 + 2 * i}', 'appium_port': args.base_port + i}
+            for i in range(args.devices)
+        ],
+        'automation_steps': {
+            'app_package': 'com.example.app',
+            'actions': [
+                {'type': 'click', 'text': 'Accept'},
+                {'type': 'scroll'},
+                {'type': 'back'},
+            ],
+        },
+        'logging': {'level': 'WARNING', 'file': os.path.join(workdir, 'automation.log')},
+    }
+    with open(os.path.join(workdir, 'config.json'), 'w') as f:
+        json.dump(config, f, indent=4)
+
+class ThreadSampler:
+    """Samples the live thread count in the background."""
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.peak = threading.active_count()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, threading.active_count())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+def summarize(args, results, wall, peak_threads, servers):
+    phases = defaultdict(list)
+    commands = saved = 0
+    for result in results:
+        profile = result.get('profile') or {}
+        commands += profile.get('commands', 0)
+        saved += profile.get('commands_saved', 0)
+        for phase in profile.get('phases', []):
+            phases[phase['name']].append(phase['seconds'])
+
+    succeeded = sum(1 for r in results if r['status'] == 'Success')
+    lines = [
+        f"engine={args.engine} rows={args.rows} devices={args.devices} "
+        f"command_ms={args.command_ms} session_ms={args.session_ms}",
+        f"wall: {wall:.2f}s  throughput: {len(results) / wall:.1f} rows/s  succeeded: {succeeded}/{len(results)}",
+        f"peak threads: {peak_threads}  sessions created: {sum(s.sessions_created for s in servers)}  "
+        f"http commands: {sum(s.commands for s in servers)}  profiled commands/row: "
+        f"{commands / max(len(results), 1):.1f}  saved by batching/row: {saved / max(len(results), 1):.1f}",
+        f"{'phase':<24}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}",
+    ]
+    for name, values in sorted(phases.items(), key=lambda item: -sum(item[1])):
+        lines.append(
+            f"{name:<24}{len(values):>7}{percentile(values, 50) * 1000:>10.1f}{percentile(values, 95) * 1000:>10.1f}"
+        )
+    return '\n'.join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline throughput benchmark")
+    parser.add_argument('--rows', type=int, default=1000)
+    parser.add_argument('--devices', type=int, default=20)
+    parser.add_argument('--engine', choices=['thread', 'asyncio'], default='thread')
+    parser.add_argument('--async-threads', type=int, default=4)
+    parser.add_argument('--max-threads', type=int, help="Thread engine pool size (default: one per device)")
+    parser.add_argument('--wait-minutes', type=float, default=0)
+    parser.add_argument('--dry-run', action='store_true', help="Skip the wait_minutes dwell")
+    parser.add_argument('--time-scale', type=float, help="Compress the wait_minutes dwell N times")
+    parser.add_argument('--base-port', type=int, default=4800)
+    parser.add_argument('--command-ms', type=float, default=5)
+    parser.add_argument('--session-ms', type=float, default=200)
+    parser.add_argument('--fixture', help="JSON file overriding the fake server fixture")
+    parser.add_argument('--output', help="Also append the summary to this file")
+    args = parser.parse_args()
+
+    fixture = json.load(open(args.fixture)) if args.fixture else {}
+    fixture.setdefault('command_ms', args.command_ms)
+    fixture.setdefault('session_ms', args.session_ms)
+    servers = start_fake_servers(args.devices, args.base_port, fixture)
+
+    workdir = tempfile.mkdtemp(prefix='automation-bench-')
+    write_inputs(workdir, args)
+    previous_dir = os.getcwd()
+    os.chdir(workdir)
+    try:
+        import main as automation_main
+        with ThreadSampler() as sampler:
+            started = time.monotonic()
+            argv = ['--dry-run'] if args.dry_run else []
+            if args.time_scale:
+                argv += ['--time-scale', str(args.time_scale)]
+            automation_main.main(argv)
+            wall = time.monotonic() - started
+        results = list(Checkpoint('checkpoint.jsonl').load().values())
+    finally:
+        os.chdir(previous_dir)
+        for server in servers:
+            server.stop()
+
+    summary = summarize(args, results, wall, sampler.peak, servers)
+    print(summary)
+    print(f"artifacts: {workdir}")
+    if args.output:
+        with open(args.output, 'a') as f:
+            f.write(summary + '\n\n')
+
+if __name__ == '__main__':
+    main()
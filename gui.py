@@ -5,10 +5,19 @@
 import tkinter as tk
 from tkinter import ttk, scrolledtext, messagebox
 import json
+import logging
 import os
+import queue
 import webbrowser
+from logging.handlers import QueueHandler
 from threading import Thread
 
+from src.appium_manager import appium_ready, get_appium_settings
+from src.logger_setup import LOG_FORMAT
+
+# Oldest lines are trimmed from the log viewer beyond this many
+MAX_LOG_LINES = 2000
+
 class AutomationGUI(tk.Tk):
     def __init__(self):
         super().__init__()
@@ -20,6 +29,10 @@ class AutomationGUI(tk.Tk):
         self.config_path = 'config.json'
         self.config_data = {}
 
+        # Log records reach the viewer through this queue instead of re-reading automation.log
+        self.log_queue = queue.Queue()
+        self.log_handler = None
+
         self.create_widgets()
         self.load_config()
 
@@ -72,6 +85,7 @@ class AutomationGUI(tk.Tk):
         self.run_button.config(state='disabled')
         self.report_button.config(state='disabled')
         self.status_var.set("Status: Running...")
+        self.attach_log_handler()
         automation_thread = Thread(target=self.run_automation, daemon=True)
         automation_thread.start()
         self.after(1000, self.update_log_viewer)
@@ -89,18 +103,42 @@ class AutomationGUI(tk.Tk):
             if os.path.exists('report.html'):
                 self.report_button.config(state='normal')
 
+    def attach_log_handler(self):
+        self.log_text.config(state='normal')
+        self.log_text.delete('1.0', tk.END)
+        self.log_text.config(state='disabled')
+        if not self.log_handler:
+            self.log_handler = QueueHandler(self.log_queue)
+            self.log_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+            logging.getLogger().addHandler(self.log_handler)
+
+    def detach_log_handler(self):
+        if self.log_handler:
+            logging.getLogger().removeHandler(self.log_handler)
+            self.log_handler = None
+
     def update_log_viewer(self):
-        try:
-            with open('automation.log', 'r') as f:
-                log_content = f.read()
+        running = "Running" in self.status_var.get()
+        if not running:
+            self.detach_log_handler()
+
+        lines = []
+        while True:
+            try:
+                lines.append(self.log_queue.get_nowait().msg)
+            except queue.Empty:
+                break
+
+        if lines:
             self.log_text.config(state='normal')
-            self.log_text.delete('1.0', tk.END)
-            self.log_text.insert(tk.END, log_content)
+            self.log_text.insert(tk.END, '\n'.join(lines) + '\n')
+            line_count = int(self.log_text.index('end-1c').split('.')[0])
+            if line_count > MAX_LOG_LINES:
+                self.log_text.delete('1.0', f'{line_count - MAX_LOG_LINES + 1}.0')
             self.log_text.see(tk.END)
             self.log_text.config(state='disabled')
-        except FileNotFoundError:
-            pass
-        if "Running" in self.status_var.get():
+
+        if running:
             self.after(1000, self.update_log_viewer)
 
     def load_config(self):
@@ -167,13 +205,11 @@ class AutomationGUI(tk.Tk):
         workers = self.config_data.get('parallel_workers', [])
         if not workers:
             errors.append("No parallel_workers defined in config.json.")
-        else:
-            import socket
+        elif not get_appium_settings(self.config_data)['manage']:
             for i, worker in enumerate(workers):
                 port = worker.get('appium_port')
-                with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                    if s.connect_ex(('127.0.0.1', port)) != 0:
-                        errors.append(f"Worker {i+1}: Appium server not listening on port {port}.")
+                if not appium_ready(port):
+                    errors.append(f"Worker {i+1}: Appium server not ready on port {port}.")
         self.log_text.config(state='normal')
         self.log_text.insert(tk.END, f"[CHECK] Appium Workers: {'FAIL' if any('Worker' in e or 'parallel_workers' in e for e in errors) else 'OK'}\n")
         self.log_text.config(state='disabled')
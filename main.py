@@ -1,89 +1,366 @@
 #!/usr/bin/env python
 
-import csv
+import argparse
+import json
 import logging
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import os
 
-from src.config_reader import read_config
-from src.automation_manager import get_appium_driver, run_automation
-from src.logger_setup import setup_logger
-from src.report_generator import generate_html_report
+from src.adb_client import configure_adb
+from src.apk_cache import find_cached_apk, install_on_devices
+from src.appium_manager import AppiumManager, assign_ports, get_appium_settings
+from src.artifacts import configure_artifacts, get_collector
+from src.checkpoint import Checkpoint
+from src import clock
+from src.clock import configure_clock
+from src.config_reader import read_config, validate_workers
+from src.config_watcher import ConfigWatcher
+from src.coordinator import (
+    AUTHKEY_ENV, check_coordinator_settings, get_coordinator_settings, run_coordinator, run_worker,
+)
+from src.emulator_manager import DeviceStateManager, ensure_adb_server
+from src.fleet_manager import boot_fleet, get_fleet_settings
+from src.accounts_reader import count_accounts, iter_accounts
+from src.action_plan import compile_plan
+from src.async_runner import AsyncDeviceScheduler
+from src.automation_manager import capture_failure, run_automation
+from src.logger_setup import setup_logger, start_task_context, end_task_context
+from src.phase_retry import DEVICE_OFFLINE, RetryPolicy, carry_over, classify_error, with_resume_state
+from src.profiler import start_profile, end_profile
+from src.report_generator import ReportWriter, generate_html_report, order_by_row
+from src.scheduler import DeviceScheduler
+from src.session_pool import SessionPool
+from src.selector_sets import log_selector_stats
+from src.waits import configure_waits
 
-def run_single_task(task_args):
-    account, worker_config, global_config = task_args
+def run_single_task(task_args, defer_dwell=False):
+    row_index, account, worker_config, global_config, session_pool = task_args
     email = account.get('email', '')
     password = account.get('password', '')
     group_link = account.get('group_link', '')
     beta_link = account.get('beta_link', '')
 
     device_id = worker_config.get('device_id')
-    appium_port = worker_config.get('appium_port')
 
+    context = start_task_context(row_index=row_index, email=email, device_id=device_id)
+    profile, profile_token = start_profile(device_id)
     logging.info(f"Task start: {email} on {device_id}")
 
+    resume = account.get('_resume') or {}
+    device_reset = global_config.get('device_reset', {}).get('enabled', False)
     result = {
+        'row_index': row_index,
         'email': email,
+        'device_id': device_id,
         'status': 'Failure',
         'details': '',
-        'screenshot_path': None
+        'screenshot_path': None,
+        'phases': carry_over(resume, device_id, device_reset),
     }
 
-    driver = None
-    try:
-        driver = get_appium_driver(device_id, appium_port)
-        if not driver:
-            raise RuntimeError(f"Driver init failed for {device_id}")
-
-        run_automation(driver, email, password, group_link, beta_link, global_config, result)
-
-    except Exception as e:
-        logging.error(f"Task failed for {email}: {e}")
-        result['details'] = str(e)
+    policy = RetryPolicy(global_config.get('retry'))
+    attempt = resume.get('attempts', 0)
+    session = None
+    while True:
+        attempt += 1
+        try:
+            session = session_pool.get(worker_config)
+            run_automation(session, email, password, group_link, beta_link, global_config, result, defer_dwell)
+            break
+        except Exception as e:
+            error_class = classify_error(e)
+            logging.error(f"Task failed for {email} ({error_class}): {e}")
+            result['details'] = str(e)
+            result['error_class'] = error_class
+            retry = policy.should_retry(error_class, attempt)
+            if not retry or policy.should_move(error_class):
+                # Once per device, from the attempt that is given up on
+                capture_failure(session, device_id, email, result)
+            if not retry:
+                break
+            if policy.should_move(error_class):
+                # The scheduler runs the row again on another device, keeping the finished phases
+                logging.warning(f"Moving {email} off {device_id} after {error_class}")
+                result['retry_row'] = (row_index, dict(account, _resume={
+                    'phases': result['phases'], 'device_id': device_id, 'attempts': attempt,
+                }))
+                break
+            delay = policy.delay(attempt)
+            logging.warning(f"Retrying {email} after {error_class} in {delay:g}s (attempt {attempt + 1})")
+            clock.sleep(delay)
+            if error_class == 'session_lost':
+                session_pool.discard(worker_config)
+    result['attempts'] = attempt
 
+    result['profile'] = end_profile(profile, profile_token)
     logging.info(f"Task end: {email} - {result['status']}")
+    end_task_context(context)
     return result
 
-def main():
-    setup_logger()
-    logging.info("=== Automation Framework Started ===")
+def unrun_result(row, details):
+    """The failure recorded for a row that never reached a device, keeping its earlier phase state for --resume."""
+    row_index, account = row
+    resume = account.get('_resume') or {}
+    return {
+        'row_index': row_index,
+        'email': account.get('email', ''),
+        'device_id': resume.get('device_id'),
+        'status': 'Failure',
+        'details': details,
+        'error_class': DEVICE_OFFLINE,
+        'screenshot_path': None,
+        'phases': resume.get('phases') or {},
+        'attempts': resume.get('attempts', 0),
+    }
+
+ENGINES = ('thread', 'asyncio')
+
+class DeviceSetup:
+    """Device setup for one run_rows call: warm sessions, cached APK installs and baseline snapshots."""
+
+    def __init__(self, workers, config):
+        self.config = config
+        self.session_pool = SessionPool()
+        self.app_package = config.get('automation_steps', {}).get('app_package')
+        self.apk_path = find_cached_apk(config.get('apk_cache_dir'), self.app_package) if self.app_package else None
+        if self.apk_path:
+            install_on_devices(
+                config.get('android_sdk_path', ''), [w.get('device_id') for w in workers], self.app_package, self.apk_path
+            )
+
+        self.on_release = None
+        self.state_manager = None
+        reset_settings = config.get('device_reset', {})
+        if reset_settings.get('enabled'):
+            ensure_adb_server(config.get('android_sdk_path', ''))
+            self.state_manager = DeviceStateManager(
+                reset_settings.get('snapshot', 'clean_baseline'), reset_settings.get('timeout_seconds', 120),
+                reset_settings.get('snapshot_timeout_seconds', 300),
+            )
+            self.state_manager.prepare([w.get('device_id') for w in workers])
+            self.on_release = self._reset
+
+    def _reset(self, worker):
+        self.session_pool.discard(worker)
+        return self.state_manager.reset(worker.get('device_id'))
 
+    def prepare(self, worker):
+        """Sets up a device added during the run. Returns False if it cannot be used."""
+        device_id = worker.get('device_id')
+        if self.apk_path and not install_on_devices(
+                self.config.get('android_sdk_path', ''), [device_id], self.app_package, self.apk_path)[device_id]:
+            return False
+        if self.state_manager:
+            self.state_manager.prepare([device_id])
+        return True
+
+    def close(self):
+        self.session_pool.close_all()
+        get_collector().flush()
+        if self.state_manager:
+            logging.info("Device resets:")
+            self.state_manager.log_stats()
+
+def run_rows(rows, workers, config, on_result=None, collect=True, watch_config=None, appium=None, total=None,
+             report_unrun=True):
+    """Runs (row_index, account) rows on the given devices with the configured engine.
+
+    With watch_config set to the config path, devices added to or removed
+    from parallel_workers during the run join or leave the pool; with an
+    AppiumManager, added devices get a managed Appium server too. total is
+    the row count, for the pending figure in the queue log. With report_unrun,
+    rows left when every device is gone are reported as failures.
+    """
+    setup = DeviceSetup(workers, config)
+    session_pool = setup.session_pool
+    engine = config.get('engine', 'thread')
+    # A device that leaves the pool no longer needs its managed Appium server
+    on_leave = (lambda worker: appium.release(worker.get('appium_port'))) if appium else None
+
+    if engine == 'asyncio':
+        scheduler = AsyncDeviceScheduler(
+            workers,
+            lambda row, worker: run_single_task((*row, worker, config, session_pool), defer_dwell=True),
+            session_pool,
+            max_threads=config.get('async_threads', 4),
+            sdk_path=config.get('android_sdk_path') or None,
+            on_release=setup.on_release,
+            fail_fn=unrun_result if report_unrun else None,
+            on_leave=on_leave,
+        )
+    else:
+        scheduler = DeviceScheduler(
+            workers,
+            lambda row, worker: run_single_task((*row, worker, config, session_pool), defer_dwell=True),
+            session_pool,
+            max_threads=config.get('max_threads'),
+            on_release=setup.on_release,
+            fail_fn=unrun_result if report_unrun else None,
+            on_leave=on_leave,
+        )
+    logging.info(f"Engine: {engine}")
+
+    watcher = None
+    if watch_config:
+        def prepare(worker):
+            if appium and not appium.launch(worker['appium_port']).wait_ready():
+                return False
+            return setup.prepare(worker)
+
+        watcher = ConfigWatcher(
+            watch_config,
+            lambda new_workers: scheduler.update_workers(
+                assign_ports(new_workers, appium.settings) if appium else new_workers, prepare
+            ),
+            config.get('watch_interval_seconds', 2),
+        )
+        watcher.start()
+    try:
+        return scheduler.run(rows, on_result, collect, total)
+    finally:
+        if watcher:
+            watcher.stop()
+        setup.close()
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Android beta testing automation")
+    parser.add_argument('--coordinator', action='store_true',
+                        help="Split the accounts into shards and run them on worker processes")
+    parser.add_argument('--worker', metavar='HOST:PORT',
+                        help="Run as a worker for the coordinator at HOST:PORT")
+    parser.add_argument('--resume', action='store_true',
+                        help="Skip rows the checkpoint already records as successful")
+    parser.add_argument('--dry-run', action='store_true',
+                        help="Skip wait_minutes and wait actions; selector polling still runs in real time")
+    parser.add_argument('--time-scale', type=float, metavar='N',
+                        help="Compress wait_minutes and wait actions N times")
+    parser.add_argument('--boot-fleet', action='store_true',
+                        help="Boot the AVDs in the fleet section and use them as the workers")
+    parser.add_argument('--watch-config', action='store_true',
+                        help="Add and drain devices as parallel_workers changes in config.json during the run")
+    parser.add_argument('--worker-devices', help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
     config = read_config()
-    accounts_file = config.get('accounts_file', 'accounts.csv')
+    setup_logger(config.get('logging'))
+    logging.info("=== Automation Framework Started ===")
+
+    configure_waits(config)
+    configure_adb(config)
+    configure_artifacts(config)
+    try:
+        configure_clock(config, args.dry_run, args.time_scale)
+        config['action_plan'] = compile_plan(config.get('automation_steps', {}).get('actions'))
+    except ValueError as e:
+        logging.error(f"Invalid config: {e}")
+        return
+    if config.get('engine', 'thread') not in ENGINES:
+        logging.error(f"Invalid config: engine must be one of {', '.join(ENGINES)}, not {config['engine']!r}")
+        return
     workers = config.get('parallel_workers', [])
+    appium = None
+    appium_settings = get_appium_settings(config)
+    if args.worker_devices:
+        workers = json.loads(args.worker_devices)
+    elif args.boot_fleet:
+        if get_fleet_settings(config)['start_appium']:
+            appium = AppiumManager(appium_settings)
+        workers = boot_fleet(config, appium)
+    elif appium_settings['manage']:
+        appium = AppiumManager(appium_settings)
+        workers = appium.start_for(workers)
 
+    if appium:
+        appium.supervise()
+    try:
+        run_accounts(args, config, workers, appium)
+    finally:
+        if appium:
+            appium.stop()
+
+def run_accounts(args, config, workers, appium=None):
+    """Runs the accounts on the workers: locally, as coordinator, or as a worker process."""
     if not workers:
         logging.error("No workers in config")
         return
 
-    try:
-        with open(accounts_file, 'r', newline='') as f:
-            accounts = list(csv.DictReader(f))
-    except FileNotFoundError:
-        logging.error(f"Accounts file not found: {accounts_file}")
+    watch_config = None
+    if args.watch_config:
+        if args.worker_devices or args.boot_fleet or args.coordinator or args.worker:
+            logging.warning("--watch-config only applies to parallel_workers in a local run, ignored")
+        else:
+            try:
+                validate_workers(config)
+            except ValueError as e:
+                logging.error(f"Invalid config: {e}")
+                return
+            watch_config = 'config.json'
+
+    if args.worker:
+        host, port = args.worker.rsplit(':', 1)
+        authkey = get_coordinator_settings(config)['authkey']
+        if not authkey:
+            logging.error(f"Set {AUTHKEY_ENV} or coordinator.authkey to the coordinator's authkey")
+            return
+        # Rows this worker cannot run stay unreported, so the coordinator requeues them for other workers
+        run_worker((host, int(port)), authkey, workers,
+                   lambda rows, devices, on_result: run_rows(rows, devices, config, on_result, collect=False,
+                                                             report_unrun=False))
         return
 
-    if not accounts:
-        logging.warning("No accounts found")
+    if args.coordinator:
+        try:
+            check_coordinator_settings(get_coordinator_settings(config))
+        except ValueError as e:
+            logging.error(f"Invalid config: {e}")
+            return
+
+    accounts_file = config.get('accounts_file', 'accounts.csv')
+    if not os.path.exists(accounts_file):
+        logging.error(f"Accounts file not found: {accounts_file}")
         return
 
-    logging.info(f"Accounts: {len(accounts)}, Workers: {len(workers)}")
+    checkpoint = Checkpoint(config.get('checkpoint_file', 'checkpoint.jsonl'))
+    previous = {}
+    if args.resume:
+        previous = checkpoint.load()
+        completed = checkpoint.completed_keys(previous)
+        logging.info(f"Resuming: {len(completed)} rows already succeeded")
+    else:
+        checkpoint.start_fresh()
+        completed = set()
 
-    tasks = [(accounts[i], workers[i % len(workers)], config) for i in range(len(accounts))]
-    results = []
+    total = count_accounts(accounts_file, skip=completed)
+    logging.info(f"Accounts file: {accounts_file}, Rows: {total}, Workers: {len(workers)}")
 
-    with ThreadPoolExecutor(max_workers=len(workers)) as executor:
-        futures = {executor.submit(run_single_task, t): t for t in tasks}
-        for future in as_completed(futures):
-            try:
-                results.append(future.result())
-            except Exception as e:
-                logging.error(f"Task exception: {e}")
+    rows = with_resume_state(iter_accounts(accounts_file, skip=completed), previous)
+    live_report = ReportWriter()
+    live_report.open()
 
-    if results:
-        email_order = [a['email'] for a in accounts]
-        results.sort(key=lambda r: email_order.index(r['email']) if r['email'] in email_order else 999)
-        generate_html_report(results)
+    def record(result):
+        checkpoint.append(result)
+        live_report.add(result)
+
+    try:
+        if args.coordinator:
+            worker_args = ['--dry-run'] if args.dry_run else []
+            if args.time_scale:
+                worker_args += ['--time-scale', str(args.time_scale)]
+            run_coordinator(config, rows, workers, record, worker_args, fail_fn=unrun_result)
+        else:
+            run_rows(rows, workers, config, record, collect=False, watch_config=watch_config, appium=appium, total=total)
+    finally:
+        live_report.close()
+
+    # Rewrite the report in row order, including rows finished by earlier runs
+    results = order_by_row(checkpoint.load().values())
+    if not results:
+        logging.warning("No accounts found")
+        return
+    generate_html_report(results)
 
+    log_selector_stats()
     success = sum(1 for r in results if r['status'] == 'Success')
     logging.info(f"=== Done: {success}/{len(results)} succeeded ===")
 
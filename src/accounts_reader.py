@@ -0,0 +1,22 @@
+#!/usr/bin/env python
+
+"""Streams account rows from the accounts CSV instead of loading the whole file."""
+
+import csv
+
+def iter_accounts(accounts_file, skip=None):
+    """Yields (row_index, account) pairs lazily, leaving out rows whose key is in skip."""
+    skip = skip or set()
+    with open(accounts_file, 'r', newline='') as f:
+        for row_index, account in enumerate(csv.DictReader(f)):
+            if row_key(row_index, account.get('email', '')) in skip:
+                continue
+            yield row_index, account
+
+def count_accounts(accounts_file, skip=None):
+    """Counts the rows iter_accounts would yield, in one streaming pass."""
+    return sum(1 for _ in iter_accounts(accounts_file, skip))
+
+def row_key(row_index, email):
+    """Identifies a row by position and email, so an edited file does not skip the wrong row."""
+    return f"{row_index}:{email}"
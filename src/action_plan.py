@@ -0,0 +1,282 @@
+#!/usr/bin/env python
+
+"""Compiles automation_steps.actions into a validated plan of typed steps.
+
+The plan is built once at startup, so config mistakes surface before any
+device time is spent, and each step already holds its resolved locator.
+Coordinates are fractions of the screen and are scaled to each device's
+window size, which is queried once per session.
+"""
+
+import logging
+
+from appium.webdriver.common.appiumby import AppiumBy
+
+from src import clock
+from src.gestures import fling_to_end, swipes, taps
+from src.waits import WAIT_SETTINGS, wait_until
+
+class StepFailed(Exception):
+    """An assert step did not hold; fails the task."""
+
+_window_sizes = {}
+
+def window_size(driver):
+    """Returns (width, height) of the device screen, cached per Appium session."""
+    size = _window_sizes.get(driver.session_id)
+    if size is None:
+        rect = driver.get_window_size()
+        size = _window_sizes[driver.session_id] = (rect['width'], rect['height'])
+    return size
+
+def _text_xpath(text):
+    if '"' not in text:
+        return f'//*[contains(@text,"{text}")]'
+    if "'" not in text:
+        return f"//*[contains(@text,'{text}')]"
+    raise ValueError(f"text {text!r} contains both quote characters")
+
+def compile_locator(action, where):
+    """Resolves element_id / accessibility_id / xpath / text to an Appium (by, value) pair."""
+    keys = [key for key in ('element_id', 'accessibility_id', 'xpath', 'text') if action.get(key)]
+    if len(keys) != 1:
+        raise ValueError(f"{where}: needs exactly one of element_id, accessibility_id, xpath or text")
+    key = keys[0]
+    value = action[key]
+    if key == 'element_id':
+        return (AppiumBy.ID, value)
+    if key == 'accessibility_id':
+        return (AppiumBy.ACCESSIBILITY_ID, value)
+    if key == 'xpath':
+        return (AppiumBy.XPATH, value)
+    try:
+        return (AppiumBy.XPATH, _text_xpath(value))
+    except ValueError as e:
+        raise ValueError(f"{where}: {e}")
+
+def _find(driver, locator):
+    elements = driver.find_elements(*locator)
+    return elements[0] if elements else None
+
+class Step:
+    def __init__(self, action, where):
+        self.description = action.get('description', action['type'])
+        self.timeout = _number(action, 'timeout_seconds', where, WAIT_SETTINGS['timeout_seconds'])
+
+    def run(self, driver):
+        raise NotImplementedError
+
+class ClickStep(Step):
+    def __init__(self, action, where):
+        super().__init__(action, where)
+        self.locator = compile_locator(action, where)
+
+    def run(self, driver):
+        element = wait_until(lambda: _find(driver, self.locator), self.timeout, f'{self.locator[1]} to click')
+        if not element:
+            return False
+        element.click()
+        return True
+
+class WaitStep(Step):
+    def __init__(self, action, where):
+        super().__init__(action, where)
+        self.seconds = _number(action, 'duration_seconds', where, 5)
+
+    def run(self, driver):
+        clock.dwell(self.seconds)
+        return True
+
+class ScrollStep(Step):
+    """Swipes across the given fraction of the screen; down means revealing content further down."""
+
+    DIRECTIONS = ('down', 'up', 'left', 'right')
+
+    def __init__(self, action, where):
+        super().__init__(action, where)
+        self.direction = action.get('direction', 'down')
+        if self.direction not in self.DIRECTIONS:
+            raise ValueError(f"{where}: direction must be one of {', '.join(self.DIRECTIONS)}")
+        self.distance = _number(action, 'distance', where, 0.6)
+        if not 0 < self.distance < 1:
+            raise ValueError(f"{where}: distance is a fraction of the screen between 0 and 1")
+        self.duration_ms = int(_number(action, 'duration_ms', where, 400))
+        self.count = int(_number(action, 'count', where, 1))
+        if self.count < 1:
+            raise ValueError(f"{where}: count must be at least 1")
+
+    def points(self, width, height):
+        """Start and end points of the swipe for the given screen size."""
+        half = self.distance / 2
+        x, y = width // 2, height // 2
+        if self.direction == 'down':
+            return (x, int(height * (0.5 + half))), (x, int(height * (0.5 - half)))
+        if self.direction == 'up':
+            return (x, int(height * (0.5 - half))), (x, int(height * (0.5 + half)))
+        if self.direction == 'right':
+            return (int(width * (0.5 + half)), y), (int(width * (0.5 - half)), y)
+        return (int(width * (0.5 - half)), y), (int(width * (0.5 + half)), y)
+
+    def run(self, driver, count=None):
+        stroke = self.points(*window_size(driver))
+        swipes(driver, [stroke] * (count or self.count), self.duration_ms)
+        return True
+
+class TapStep(Step):
+    """Taps a chain of points, given as [x, y] screen fractions, in one request."""
+
+    def __init__(self, action, where):
+        super().__init__(action, where)
+        points = action.get('points')
+        if not isinstance(points, list) or not points:
+            raise ValueError(f"{where}: points must be a non-empty list of [x, y] fractions")
+        for point in points:
+            if (not isinstance(point, list) or len(point) != 2
+                    or not all(isinstance(v, (int, float)) and 0 <= v <= 1 for v in point)):
+                raise ValueError(f"{where}: each point is [x, y] with fractions between 0 and 1")
+        self.points = points
+        self.interval_ms = int(_number(action, 'interval_ms', where, 100))
+
+    def run(self, driver):
+        width, height = window_size(driver)
+        taps(driver, [(x * width, y * height) for x, y in self.points], self.interval_ms)
+        return True
+
+class FlingToEndStep(Step):
+    """Flings the screen in one direction until it cannot scroll any further."""
+
+    def __init__(self, action, where):
+        super().__init__(action, where)
+        self.direction = action.get('direction', 'down')
+        if self.direction not in ScrollStep.DIRECTIONS:
+            raise ValueError(f"{where}: direction must be one of {', '.join(ScrollStep.DIRECTIONS)}")
+        self.max_flings = int(_number(action, 'max_flings', where, 10))
+
+    def run(self, driver):
+        width, height = window_size(driver)
+        # Keep clear of the status and navigation bars
+        area = (0, int(height * 0.1), width, int(height * 0.8))
+        fling_to_end(driver, area, self.direction, self.max_flings)
+        return True
+
+class BackStep(Step):
+    def run(self, driver):
+        driver.back()
+        return True
+
+class WaitForStep(Step):
+    """Waits for an element to appear, or with "gone": true to disappear."""
+
+    def __init__(self, action, where):
+        super().__init__(action, where)
+        self.locator = compile_locator(action, where)
+        self.gone = bool(action.get('gone', False))
+
+    def check(self, driver):
+        if self.gone:
+            return wait_until(lambda: _find(driver, self.locator) is None, self.timeout,
+                              f'{self.locator[1]} to disappear')
+        return wait_until(lambda: _find(driver, self.locator), self.timeout, f'{self.locator[1]}')
+
+    def run(self, driver):
+        return bool(self.check(driver))
+
+class AssertStep(WaitForStep):
+    """Like wait_for, but fails the task if the condition does not hold in time."""
+
+    def run(self, driver):
+        if not self.check(driver):
+            state = 'gone' if self.gone else 'present'
+            raise StepFailed(f"Assertion failed: {self.locator[1]} not {state}")
+        return True
+
+class RepeatStep(Step):
+    def __init__(self, action, where):
+        super().__init__(action, where)
+        self.times = int(_number(action, 'times', where, None))
+        if self.times < 1:
+            raise ValueError(f"{where}: times must be at least 1")
+        self.steps = _compile_steps(action.get('steps'), f'{where}.steps')
+
+    def run(self, driver):
+        for _ in range(self.times):
+            _run_steps(driver, self.steps)
+        return True
+
+class ScrollUntilStep(ScrollStep):
+    """Scrolls until the element is on screen, optionally clicking it."""
+
+    def __init__(self, action, where):
+        super().__init__(action, where)
+        self.locator = compile_locator(action, where)
+        self.max_swipes = int(_number(action, 'max_swipes', where, 10))
+        self.click = bool(action.get('click', False))
+
+    def run(self, driver):
+        for attempt in range(self.max_swipes + 1):
+            element = _find(driver, self.locator)
+            if element:
+                if self.click:
+                    element.click()
+                return True
+            if attempt < self.max_swipes:
+                super().run(driver, count=1)
+        logging.warning(f"{self.locator[1]} not found after {self.max_swipes} swipes")
+        return False
+
+STEP_TYPES = {
+    'click': ClickStep,
+    'wait': WaitStep,
+    'scroll': ScrollStep,
+    'back': BackStep,
+    'tap': TapStep,
+    'fling_to_end': FlingToEndStep,
+    'wait_for': WaitForStep,
+    'assert': AssertStep,
+    'repeat': RepeatStep,
+    'scroll_until': ScrollUntilStep,
+}
+
+def _number(action, key, where, default):
+    value = action.get(key, default)
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError(f"{where}: {key} must be a number")
+    return value
+
+def _compile_steps(actions, where):
+    if not isinstance(actions, list):
+        raise ValueError(f"{where} must be a list")
+    steps = []
+    for i, action in enumerate(actions):
+        step_where = f'{where}[{i}]'
+        if not isinstance(action, dict):
+            raise ValueError(f"{step_where} must be an object")
+        step_type = STEP_TYPES.get(action.get('type'))
+        if not step_type:
+            raise ValueError(f"{step_where}: unknown type {action.get('type')!r}")
+        steps.append(step_type(action, step_where))
+    return steps
+
+def _run_steps(driver, steps):
+    for step in steps:
+        logging.info(f"Action: {step.description}")
+        try:
+            if not step.run(driver):
+                logging.warning(f"Action did not complete: {step.description}")
+        except StepFailed:
+            raise
+        except Exception as e:
+            logging.warning(f"Action failed: {e}")
+
+class ActionPlan:
+    """The compiled actions of automation_steps, run in order on each account."""
+
+    def __init__(self, steps):
+        self.steps = steps
+
+    def run(self, driver):
+        _run_steps(driver, self.steps)
+
+def compile_plan(actions):
+    """Validates the actions list and returns an ActionPlan. Raises ValueError naming the bad entry."""
+    return ActionPlan(_compile_steps(actions or [], 'automation_steps.actions'))
@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+
+"""Client for the adb server's host protocol on its local TCP socket.
+
+Device queries cost one socket round trip to the already running adb
+server instead of spawning an adb process. The server closes host-service
+connections after answering, so connections are not reused; instead a
+semaphore bounds how many sockets are open at once, and every request
+shares the same client object.
+"""
+
+import logging
+import os
+import re
+import socket
+import threading
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = int(os.environ.get('ANDROID_ADB_SERVER_PORT', 5037))
+CONSOLE_TOKEN_FILE = os.path.join(os.path.expanduser('~'), '.emulator_console_auth_token')
+
+class AdbError(Exception):
+    """The adb server refused a request or could not be reached."""
+
+class AdbClient:
+    """Talks to the adb server directly: host queries, host-serial commands and shell streams."""
+
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, timeout=10, max_connections=8):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_connections)
+
+    def _connect(self):
+        try:
+            return socket.create_connection((self.host, self.port), timeout=self.timeout)
+        except OSError as e:
+            raise AdbError(f"adb server not reachable on {self.host}:{self.port}: {e}") from e
+
+    @staticmethod
+    def _send(sock, request):
+        payload = request.encode()
+        sock.sendall(b'%04x' % len(payload) + payload)
+        status = _read_exact(sock, 4)
+        if status == b'OKAY':
+            return
+        if status == b'FAIL':
+            raise AdbError(f"{request}: {_read_prefixed(sock).decode(errors='replace')}")
+        raise AdbError(f"{request}: unexpected reply {status!r}")
+
+    def query(self, request):
+        """Sends a host request that answers with one length-prefixed string."""
+        with self._slots, self._connect() as sock:
+            try:
+                self._send(sock, request)
+                return _read_prefixed(sock).decode(errors='replace')
+            except OSError as e:
+                raise AdbError(f"{request}: {e}") from e
+
+    def version(self):
+        return int(self.query('host:version'), 16)
+
+    def is_available(self):
+        try:
+            self.version()
+            return True
+        except AdbError:
+            return False
+
+    def devices(self):
+        """Returns every device known to the server as dicts with serial, state and the -l properties."""
+        devices = []
+        for line in self.query('host:devices-l').splitlines():
+            fields = line.split()
+            if len(fields) < 2:
+                continue
+            device = {'serial': fields[0], 'state': fields[1]}
+            for field in fields[2:]:
+                key, _, value = field.partition(':')
+                device[key] = value
+            devices.append(device)
+        return devices
+
+    def device_ids(self, emulators_only=True):
+        """Serials of online devices, like `adb devices`."""
+        return [d['serial'] for d in self.devices()
+                if d['state'] == 'device' and (not emulators_only or d['serial'].startswith('emulator-'))]
+
+    def host_serial(self, serial, command):
+        """Runs a host-serial command such as get-state or get-devpath for one device."""
+        return self.query(f'host-serial:{serial}:{command}')
+
+    def get_state(self, serial):
+        try:
+            return self.host_serial(serial, 'get-state')
+        except AdbError:
+            return 'offline'
+
+    def connect(self, address):
+        """Equivalent of `adb connect host:port`. Returns the server's message."""
+        return self.query(f'host:connect:{address}')
+
+    def disconnect(self, address):
+        return self.query(f'host:disconnect:{address}')
+
+    def shell_stream(self, serial, command, timeout=None):
+        """Yields raw output chunks of a shell command as the device produces them.
+
+        timeout bounds the wait for each chunk; None waits as long as the
+        command runs, for callers that stream open-ended output.
+        """
+        with self._slots, self._connect() as sock:
+            try:
+                self._send(sock, f'host:transport:{serial}')
+                self._send(sock, f'shell:{command}')
+                sock.settimeout(timeout)
+                while True:
+                    chunk = sock.recv(65536)
+                    if not chunk:
+                        return
+                    yield chunk
+            except OSError as e:
+                raise AdbError(f"shell {command!r} on {serial}: {e}") from e
+
+    def shell(self, serial, command):
+        """Runs a shell command on the device and returns its output. Raises AdbError if the device stops answering."""
+        return b''.join(self.shell_stream(serial, command, self.timeout)).decode(errors='replace')
+
+    def getprop(self, serial, name):
+        return self.shell(serial, f'getprop {name}').strip()
+
+def _read_exact(sock, size):
+    data = b''
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise AdbError("adb server closed the connection")
+        data += chunk
+    return data
+
+def _read_prefixed(sock):
+    return _read_exact(sock, int(_read_exact(sock, 4), 16))
+
+def emulator_console(serial, command, timeout=10):
+    """Sends one command to an emulator's console, the way `adb -s emulator-N emu ...` does.
+
+    Returns the reply text. Raises AdbError on a KO reply, or if the console
+    cannot be reached or does not answer within timeout seconds.
+    """
+    match = re.match(r'^emulator-(\d+)$', serial)
+    if not match:
+        raise AdbError(f"{serial} is not an emulator")
+    try:
+        sock = socket.create_connection(('127.0.0.1', int(match.group(1))), timeout=timeout)
+    except OSError as e:
+        raise AdbError(f"Console of {serial} not reachable: {e}") from e
+    try:
+        with sock, sock.makefile('rwb') as console:
+            banner = _read_console_reply(console)
+            if 'auth' in banner and os.path.exists(CONSOLE_TOKEN_FILE):
+                with open(CONSOLE_TOKEN_FILE) as f:
+                    _console_command(console, f'auth {f.read().strip()}')
+            return _console_command(console, command)
+    except OSError as e:
+        raise AdbError(f"Console of {serial} failed on {command!r}: {e}") from e
+
+def _console_command(console, command):
+    console.write(command.encode() + b'\n')
+    console.flush()
+    return _read_console_reply(console)
+
+def _read_console_reply(console):
+    lines = []
+    for raw in console:
+        line = raw.decode(errors='replace').rstrip('\r\n')
+        if line == 'OK':
+            break
+        if line.startswith('KO'):
+            raise AdbError(line)
+        lines.append(line)
+    return '\n'.join(lines)
+
+_client = None
+_client_lock = threading.Lock()
+
+def configure_adb(config):
+    """Points the shared client at the adb server in the optional "adb" section of config.json."""
+    global _client
+    settings = config.get('adb', {})
+    with _client_lock:
+        _client = AdbClient(
+            settings.get('host', DEFAULT_HOST),
+            settings.get('port', DEFAULT_PORT),
+            max_connections=settings.get('max_connections', 8),
+        )
+
+def get_adb_client():
+    """Returns the shared client, creating one for the default server if needed."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = AdbClient()
+        return _client
+
+if __name__ == '__main__':
+    # Run as `python -m src.adb_client` from the project root
+    from src.logger_setup import setup_logger
+    setup_logger()
+    client = get_adb_client()
+    if client.is_available():
+        for device in client.devices():
+            logging.info(f"{device['serial']}: {device['state']} {device.get('model', '')}")
+    else:
+        logging.error(f"No adb server on {client.host}:{client.port}")
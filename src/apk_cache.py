@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+
+"""Installs app builds from a local APK directory instead of the Play Store."""
+
+import glob
+import logging
+import os
+import re
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from src.adb_client import AdbError, get_adb_client
+from src.emulator_manager import get_adb_path
+
+def find_cached_apk(cache_dir, package):
+    """Returns <cache_dir>/<package>.apk, or the newest <package>-<version>.apk there, or None.
+
+    A bare prefix match would also pick up e.g. com.app.beta.apk for com.app.
+    """
+    if not cache_dir:
+        return None
+    exact = os.path.join(cache_dir, f'{package}.apk')
+    if os.path.isfile(exact):
+        return exact
+    versioned = re.compile(re.escape(package) + r'-.+\.apk')
+    candidates = [
+        path for path in glob.glob(os.path.join(cache_dir, f'{glob.escape(package)}-*.apk'))
+        if versioned.fullmatch(os.path.basename(path))
+    ]
+    return max(candidates, key=os.path.getmtime) if candidates else None
+
+def is_package_installed(device_id, package):
+    """Asks the package manager on the device, through the adb server."""
+    try:
+        return get_adb_client().shell(device_id, f'pm path {package}').startswith('package:')
+    except AdbError:
+        return False
+
+def install_apk(sdk_path, device_id, apk_path, package, timeout=300):
+    """Runs `adb install -r` for one device. Returns True once the package manager lists package."""
+    logging.info(f"Installing {os.path.basename(apk_path)} on {device_id}...")
+    started = time.monotonic()
+    try:
+        result = subprocess.run(
+            [get_adb_path(sdk_path), '-s', device_id, 'install', '-r', apk_path],
+            capture_output=True, text=True, timeout=timeout,
+        )
+    except (FileNotFoundError, subprocess.TimeoutExpired) as e:
+        logging.error(f"adb install on {device_id} failed: {e}")
+        return False
+    if 'Success' not in result.stdout:
+        logging.error(f"adb install on {device_id} failed: {(result.stdout + result.stderr).strip()}")
+        return False
+    # A mislabelled APK installs fine under a different package
+    if not is_package_installed(device_id, package):
+        logging.error(f"{os.path.basename(apk_path)} installed on {device_id}, but {package} is still missing")
+        return False
+    logging.info(f"Installed on {device_id} in {time.monotonic() - started:.1f}s")
+    return True
+
+def install_on_devices(sdk_path, device_ids, package, apk_path):
+    """Installs the APK on every device that does not have the package yet, all devices at once.
+
+    Returns {device_id: installed}.
+    """
+    def install(device_id):
+        if is_package_installed(device_id, package):
+            logging.info(f"{package} already installed on {device_id}")
+            return True
+        return install_apk(sdk_path, device_id, apk_path, package)
+
+    device_ids = list(device_ids)
+    if not device_ids:
+        return {}
+    with ThreadPoolExecutor(max_workers=len(device_ids)) as executor:
+        return dict(zip(device_ids, executor.map(install, device_ids)))
@@ -0,0 +1,279 @@
+#!/usr/bin/env python
+
+"""Starts and supervises one Appium server per device.
+
+Each device gets its own Appium port plus the UiAutomator2 systemPort and
+chromedriverPort its session uses on the host, so parallel sessions never
+share a port. Servers are health-checked through /status with a short
+timeout; one that has exited or stopped answering is killed and restarted.
+"""
+
+import json
+import logging
+import os
+import shutil
+import signal
+import subprocess
+import threading
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from src.waits import wait_until
+
+# Defaults, overridable through the "appium" section of config.json
+APPIUM_DEFAULTS = {
+    'manage': False,
+    'executable': 'appium',
+    'args': [],
+    'base_port': 4723,
+    'base_system_port': 8200,
+    'base_chromedriver_port': 9515,
+    'startup_timeout_seconds': 60,
+    'status_timeout_seconds': 2,
+    'check_interval_seconds': 10,
+    'failed_checks': 2,
+    'max_restarts': 3,
+    'log_dir': None,
+}
+
+def get_appium_settings(config):
+    return dict(APPIUM_DEFAULTS, **config.get('appium', {}))
+
+def allocate_ports(index, settings, appium_port=None):
+    """Ports for the index-th device: its Appium server, systemPort and chromedriverPort."""
+    return {
+        'appium_port': appium_port or settings['base_port'] + index,
+        'system_port': settings['base_system_port'] + index,
+        'chromedriver_port': settings['base_chromedriver_port'] + index,
+    }
+
+def assign_ports(workers, settings):
+    """Returns copies of the workers with any missing port filled in; ports already set are kept.
+
+    systemPort and chromedriverPort follow the Appium port, so a device keeps
+    its ports when other devices are added to or removed from the list.
+    """
+    assigned = []
+    for i, worker in enumerate(workers):
+        appium_port = worker.get('appium_port') or settings['base_port'] + i
+        ports = allocate_ports(appium_port - settings['base_port'], settings, appium_port)
+        assigned.append(dict(ports, **{key: value for key, value in worker.items() if value is not None}))
+    return assigned
+
+def appium_ready(port, timeout=2):
+    """Returns True if an Appium server answers /status on the given port."""
+    try:
+        with urllib.request.urlopen(f'http://127.0.0.1:{port}/status', timeout=timeout) as response:
+            return json.load(response).get('value', {}).get('ready', True)
+    except Exception:
+        return False
+
+class AppiumServer:
+    """One Appium server process, or a server someone else started on the port."""
+
+    def __init__(self, port, settings):
+        self.port = port
+        self.settings = settings
+        self.process = None
+        self.owned = False
+        self.failures = 0
+        self.restarts = 0
+        self.given_up = False
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Spawns the server. Returns False if the appium executable is not found."""
+        executable = shutil.which(self.settings['executable'])
+        if not executable:
+            logging.error(f"{self.settings['executable']} not found on PATH")
+            return False
+        output = subprocess.DEVNULL
+        if self.settings['log_dir']:
+            os.makedirs(self.settings['log_dir'], exist_ok=True)
+            output = open(os.path.join(self.settings['log_dir'], f'appium_{self.port}.log'), 'ab')
+        logging.info(f"Starting Appium on port {self.port}...")
+        # In its own process group, so stop() can take down node along with any appium.cmd wrapper
+        if os.name == 'nt':
+            group = {'creationflags': subprocess.CREATE_NEW_PROCESS_GROUP}
+        else:
+            group = {'start_new_session': True}
+        self.process = subprocess.Popen(
+            [executable, '-p', str(self.port), *self.settings['args']], stdout=output, stderr=subprocess.STDOUT,
+            **group,
+        )
+        if output is not subprocess.DEVNULL:
+            output.close()
+        self.owned = True
+        self.failures = 0
+        return True
+
+    def stop(self):
+        """Stops the server and every process it started, so the port is free for a restart."""
+        if not self.owned or not self.process:
+            return
+        self._kill_tree(force=False)
+        # A wedged node can outlive its wrapper, so wait for the whole group
+        if not wait_until(lambda: not self._tree_alive(), 5):
+            self._kill_tree(force=True)
+            self.process.wait()
+        self.process = None
+
+    def _tree_alive(self):
+        if self.process.poll() is None:
+            return True
+        if os.name == 'nt':
+            return False
+        try:
+            os.killpg(self.process.pid, 0)
+            return True
+        except (ProcessLookupError, PermissionError):
+            return False
+
+    def _kill_tree(self, force):
+        if os.name == 'nt':
+            # terminate() would only end the cmd.exe running appium.cmd, leaving node on the port
+            subprocess.run(['taskkill', '/PID', str(self.process.pid), '/T', '/F'], capture_output=True)
+            if force:
+                self.process.kill()
+            return
+        try:
+            os.killpg(self.process.pid, signal.SIGKILL if force else signal.SIGTERM)
+        except (ProcessLookupError, PermissionError):
+            # The group is already gone
+            pass
+
+    def alive(self):
+        return not self.owned or (self.process is not None and self.process.poll() is None)
+
+    def ready(self):
+        return self.alive() and appium_ready(self.port, self.settings['status_timeout_seconds'])
+
+    def wait_ready(self, timeout=None):
+        timeout = timeout or self.settings['startup_timeout_seconds']
+        # Stop early if the process exits, e.g. because the port is taken
+        return bool(wait_until(lambda: self.ready() or not self.alive(), timeout,
+                               f'Appium on port {self.port}')) and self.ready()
+
+    def restart(self):
+        self.stop()
+        self.restarts += 1
+        return self.start() and self.wait_ready()
+
+    def retire(self):
+        """Stops the server for good; a check running at the same time cannot restart it."""
+        with self._lock:
+            self.given_up = True
+            self.stop()
+
+    def check(self):
+        """Restarts the server if it has exited or missed failed_checks probes in a row. Returns True if healthy."""
+        with self._lock:
+            return self._check()
+
+    def _check(self):
+        if self.given_up:
+            return False
+        if self.ready():
+            self.failures = 0
+            return True
+        self.failures += 1
+        if self.alive() and self.failures < self.settings['failed_checks']:
+            logging.warning(f"Appium on port {self.port} did not answer /status")
+            return False
+        if not self.owned:
+            logging.error(f"Appium on port {self.port} is down and was not started by this run")
+            return False
+        if self.restarts >= self.settings['max_restarts']:
+            logging.error(f"Appium on port {self.port} failed {self.restarts} restarts, giving up on it")
+            self.given_up = True
+            return False
+        state = 'exited' if not self.alive() else 'stopped answering'
+        logging.warning(f"Appium on port {self.port} {state}, restarting")
+        return self.restart()
+
+class AppiumManager:
+    """Owns the Appium servers of a run: starts them, checks them in the background and stops them."""
+
+    def __init__(self, settings):
+        self.settings = settings
+        self.servers = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def launch(self, port):
+        """Starts a server on the port, or adopts one that already answers. Does not wait for it."""
+        with self._lock:
+            server = self.servers.get(port)
+            if server:
+                return server
+            server = self.servers[port] = AppiumServer(port, self.settings)
+        if appium_ready(port, self.settings['status_timeout_seconds']):
+            logging.info(f"Appium already running on port {port}")
+        else:
+            server.start()
+        return server
+
+    def start_for(self, workers):
+        """Starts a server for each worker and waits for them together. Returns the workers whose server is up."""
+        workers = assign_ports(workers, self.settings)
+        if not workers:
+            return []
+        servers = [self.launch(worker['appium_port']) for worker in workers]
+        with ThreadPoolExecutor(max_workers=len(servers)) as executor:
+            ready = list(executor.map(lambda server: server.wait_ready(), servers))
+        for worker, up in zip(workers, ready):
+            if not up:
+                logging.error(f"Appium for {worker['device_id']} did not come up on port {worker['appium_port']}")
+        return [worker for worker, up in zip(workers, ready) if up]
+
+    def release(self, port):
+        """Stops supervising the server on the port and stops it if this run started it."""
+        with self._lock:
+            server = self.servers.pop(port, None)
+        if server:
+            logging.info(f"Releasing Appium on port {port}")
+            server.retire()
+
+    def check_all(self):
+        with self._lock:
+            servers = list(self.servers.values())
+        if not servers:
+            return
+        # In parallel, so one hung server does not hold up the rest
+        with ThreadPoolExecutor(max_workers=len(servers)) as executor:
+            list(executor.map(lambda server: server.check(), servers))
+
+    def supervise(self):
+        """Checks every server each check_interval_seconds on a background thread until stop()."""
+        def run():
+            while not self._stop.wait(self.settings['check_interval_seconds']):
+                try:
+                    self.check_all()
+                except Exception as e:
+                    logging.error(f"Appium health check failed: {e}")
+
+        self._thread = threading.Thread(target=run, name='appium-supervisor', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops supervising and terminates the servers this run started."""
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        with self._lock:
+            servers = list(self.servers.values())
+            self.servers.clear()
+        for server in servers:
+            if server.restarts:
+                logging.info(f"Appium on port {server.port} was restarted {server.restarts} times")
+            server.stop()
+
+if __name__ == '__main__':
+    # Run as `python -m src.appium_manager` from the project root
+    from src.config_reader import read_config
+    from src.logger_setup import setup_logger
+    setup_logger()
+    config = read_config()
+    manager = AppiumManager(get_appium_settings(config))
+    print(json.dumps(manager.start_for(config.get('parallel_workers', [])), indent=4))
@@ -0,0 +1,223 @@
+#!/usr/bin/env python
+
+"""Failure artifacts: screenshot, page source and logcat, written off the worker thread.
+
+capture() only fetches what needs the live session (the screenshot and page
+source) and returns the file paths right away. Decoding, downscaling,
+compression, logcat and disk writes happen on a small background pool.
+Identical screenshots are stored once, and the directory is kept under a
+size cap by deleting the oldest files first.
+"""
+
+import base64
+import gzip
+import hashlib
+import io
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from PIL import Image, features
+except ImportError:
+    Image = None
+
+from src.adb_client import AdbError, get_adb_client
+
+# Defaults, overridable through the "artifacts" section of config.json
+ARTIFACT_DEFAULTS = {
+    'dir': 'artifacts',
+    'max_mb': 500,
+    'format': 'webp',
+    'quality': 70,
+    'max_width': 720,
+    'page_source': True,
+    'logcat_lines': 500,
+    'workers': 2,
+}
+
+# <name>_<date>-<time>_<ms>.<ext>, the names capture() gives its files
+ARTIFACT_NAME = re.compile(r'_\d{8}-\d{6}_\d{3}\.(png|jpg|webp|source\.gz|logcat\.gz)$')
+
+class ArtifactCollector:
+    """Captures failure artifacts and writes them in the background under a disk cap."""
+
+    def __init__(self, settings=None):
+        settings = dict(ARTIFACT_DEFAULTS, **(settings or {}))
+        self.directory = settings['dir']
+        self.max_bytes = int(settings['max_mb'] * 1024 * 1024)
+        self.quality = settings['quality']
+        self.max_width = settings['max_width']
+        self.keep_page_source = settings['page_source']
+        self.logcat_lines = settings['logcat_lines']
+        self.image_format = self._image_format(settings['format'])
+        self._executor = ThreadPoolExecutor(max_workers=settings['workers'], thread_name_prefix='artifacts')
+        self._pending = set()
+        self._lock = threading.Lock()
+        # path -> size, oldest first; screenshot hash -> the file it was written to
+        self._files = OrderedDict()
+        self._total_bytes = 0
+        self._by_hash = {}
+        os.makedirs(self.directory, exist_ok=True)
+        self._scan()
+
+    @staticmethod
+    def _image_format(requested):
+        if Image is None:
+            return 'png'
+        if requested == 'webp' and not features.check('webp'):
+            return 'jpeg'
+        return requested
+
+    def _scan(self):
+        """Picks up artifacts left by earlier runs so they count towards the cap. Other files are left alone."""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and ARTIFACT_NAME.search(entry.name):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, entry.path, stat.st_size))
+        for _, path, size in sorted(entries):
+            self._files[path] = size
+            self._total_bytes += size
+
+    def capture(self, driver, device_id, name):
+        """Collects artifacts for a failure. Returns {'screenshot', 'page_source', 'logcat'} paths.
+
+        Only the Appium calls run on the caller's thread. With no live driver
+        the screenshot is taken with adb screencap in the background.
+        """
+        stem = os.path.join(self.directory, f"{name}_{time.strftime('%Y%m%d-%H%M%S')}_{int(time.time() * 1000) % 1000:03d}")
+        paths = {}
+
+        screenshot = source = None
+        if driver:
+            try:
+                screenshot = driver.get_screenshot_as_base64()
+            except Exception as e:
+                logging.debug(f"Screenshot failed: {e}")
+            if self.keep_page_source:
+                try:
+                    source = driver.page_source
+                except Exception as e:
+                    logging.debug(f"Page source failed: {e}")
+
+        extension = 'jpg' if self.image_format == 'jpeg' else self.image_format
+        if screenshot is not None:
+            digest = hashlib.sha1(screenshot.encode()).hexdigest()
+            with self._lock:
+                existing = self._by_hash.get(digest)
+                if not existing:
+                    self._by_hash[digest] = f'{stem}.{extension}'
+            paths['screenshot'] = existing or f'{stem}.{extension}'
+            if not existing:
+                self._submit(self._write_screenshot, paths['screenshot'], base64.b64decode, screenshot)
+        elif device_id:
+            paths['screenshot'] = f'{stem}.{extension}'
+            self._submit(self._write_screenshot, paths['screenshot'], self._screencap, device_id)
+
+        if source is not None:
+            paths['page_source'] = f'{stem}.source.gz'
+            self._submit(self._write_gzip, paths['page_source'], lambda: source)
+        if device_id and self.logcat_lines:
+            paths['logcat'] = f'{stem}.logcat.gz'
+            self._submit(self._write_gzip, paths['logcat'], lambda: self._logcat(device_id))
+        return paths
+
+    def _submit(self, fn, *args):
+        with self._lock:
+            future = self._executor.submit(self._guarded, fn, *args)
+            self._pending.add(future)
+        future.add_done_callback(self._done)
+
+    def _done(self, future):
+        with self._lock:
+            self._pending.discard(future)
+
+    @staticmethod
+    def _guarded(fn, *args):
+        try:
+            fn(*args)
+        except Exception as e:
+            logging.warning(f"Writing artifact {args[0]} failed: {e}")
+
+    def _screencap(self, device_id):
+        client = get_adb_client()
+        return b''.join(client.shell_stream(device_id, 'screencap -p', client.timeout))
+
+    def _logcat(self, device_id):
+        try:
+            return get_adb_client().shell(device_id, f'logcat -d -t {self.logcat_lines}')
+        except AdbError as e:
+            return f"logcat unavailable: {e}\n"
+
+    def _write_screenshot(self, path, load, data):
+        png = load(data)
+        if Image is None:
+            payload = png
+        else:
+            image = Image.open(io.BytesIO(png))
+            if image.width > self.max_width:
+                image.thumbnail((self.max_width, self.max_width * image.height // image.width))
+            if self.image_format == 'jpeg':
+                image = image.convert('RGB')
+            buffer = io.BytesIO()
+            image.save(buffer, self.image_format.upper(), quality=self.quality)
+            payload = buffer.getvalue()
+        self._write(path, payload)
+
+    def _write_gzip(self, path, produce):
+        text = produce()
+        self._write(path, gzip.compress(text.encode('utf-8', errors='replace'), compresslevel=6))
+
+    def _write(self, path, payload):
+        with open(path, 'wb') as f:
+            f.write(payload)
+        with self._lock:
+            self._files[path] = len(payload)
+            self._total_bytes += len(payload)
+            evicted = self._evict()
+        for old in evicted:
+            try:
+                os.remove(old)
+            except OSError:
+                pass
+        if evicted:
+            logging.info(f"Artifact cap reached, removed {len(evicted)} oldest files")
+
+    def _evict(self):
+        evicted = []
+        while self._total_bytes > self.max_bytes and len(self._files) > 1:
+            path, size = self._files.popitem(last=False)
+            self._total_bytes -= size
+            evicted.append(path)
+        if evicted:
+            gone = set(evicted)
+            self._by_hash = {digest: path for digest, path in self._by_hash.items() if path not in gone}
+        return evicted
+
+    def flush(self):
+        """Waits until every artifact captured so far is on disk."""
+        with self._lock:
+            pending = list(self._pending)
+        for future in pending:
+            future.result()
+
+_collector = None
+_collector_lock = threading.Lock()
+
+def configure_artifacts(config):
+    global _collector
+    with _collector_lock:
+        _collector = ArtifactCollector(config.get('artifacts'))
+
+def get_collector():
+    """Returns the shared collector, creating one with the defaults if needed."""
+    global _collector
+    with _collector_lock:
+        if _collector is None:
+            _collector = ArtifactCollector()
+        return _collector
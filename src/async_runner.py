@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+
+"""asyncio execution engine with the same task and result model as DeviceScheduler."""
+
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from src import clock
+from src.automation_manager import finish_automation
+from src.profiler import add_deferred_phase
+from src.emulator_manager import get_running_devices_async
+from src.scheduler import DeviceScheduler
+from src.waits import WAIT_SETTINGS, ensure_foreground
+
+class AsyncDeviceScheduler(DeviceScheduler):
+    """Drives every device from one event loop.
+
+    Orchestration, device checks and the wait_minutes dwell are coroutines.
+    The blocking Appium phases of a task run on a small shared thread pool,
+    so the thread count no longer has to match the device count.
+    """
+
+    def __init__(self, workers, task_fn, session_pool, max_threads=4, sdk_path=None, on_release=None, fail_fn=None,
+                 on_leave=None):
+        super().__init__(workers, task_fn, session_pool, max_threads, on_release, fail_fn, on_leave)
+        self.sdk_path = sdk_path
+        self._loop = None
+        self._free_async = None
+
+    def run(self, rows, on_result=None, collect=True, total=None):
+        return asyncio.run(self._run(rows, on_result, collect, total))
+
+    async def _run(self, rows, on_result, collect, total):
+        results = [] if collect else None
+        self.total = self._count(rows, total)
+        self._started = time.monotonic()
+        loop = asyncio.get_running_loop()
+
+        if self.sdk_path:
+            await self._check_devices()
+
+        free = asyncio.Queue()
+        with self._lock:
+            # Devices added before the loop started are still in the thread queue
+            while not self._free.empty():
+                free.put_nowait(self._free.get_nowait())
+            self._loop = loop
+            self._free_async = free
+
+        executor = ThreadPoolExecutor(max_workers=self.max_threads)
+        self._changed = asyncio.Event()
+        tasks = set()
+        try:
+            source = iter(rows)
+            no_devices = False
+            while True:
+                worker = await free.get()
+                if worker is None:
+                    no_devices = True
+                    break
+                if self._drain_if_idle(worker):
+                    continue
+                row = None
+                while row is None:
+                    # Running tasks may still hand a row back
+                    while self._source_done and not self._requeued and self.running:
+                        self._changed.clear()
+                        await self._changed.wait()
+                    if self._source_done and not self._requeued:
+                        break
+                    # Off the loop: the source may block, e.g. a worker waiting for its next shard
+                    row = await loop.run_in_executor(None, self._take_row, source, worker.get('device_id'))
+                if row is None:
+                    break
+                self._dispatch()
+                task = asyncio.create_task(
+                    self._run_task_async(loop, executor, row, worker, results, on_result)
+                )
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks)
+            if no_devices:
+                # Off the loop, like _take_row: the source may block
+                await loop.run_in_executor(None, self._fail_remaining, source, results, on_result)
+        finally:
+            executor.shutdown(wait=True)
+            with self._lock:
+                self._loop = None
+
+        self._finished = time.monotonic()
+        self.log_stats()
+        return results
+
+    async def _check_devices(self):
+        online = await get_running_devices_async(self.sdk_path, emulators_only=False)
+        for worker in self.workers:
+            if worker.get('device_id') not in online:
+                logging.warning(f"{worker.get('device_id')} is not listed by adb")
+
+    async def _run_task_async(self, loop, executor, row, worker, results, on_result):
+        device_id = worker.get('device_id')
+        started = time.monotonic()
+        result = None
+        try:
+            result = await loop.run_in_executor(executor, self.task_fn, row, worker)
+            if result and result.get('dwell'):
+                await self._dwell(loop, executor, worker, result)
+        except Exception as e:
+            logging.error(f"Task exception on {device_id}: {e}")
+        retry_row = result.pop('retry_row', None) if result else None
+        if retry_row is not None:
+            self._requeue(retry_row, device_id, time.monotonic() - started)
+        else:
+            self._record(device_id, time.monotonic() - started, result, results)
+            self._report(result, on_result)
+        self._changed.set()
+        self._return(worker, await loop.run_in_executor(executor, self._release, worker))
+
+    def _offer(self, worker):
+        # add_worker() and drain_worker() may be called from other threads
+        with self._lock:
+            if self._loop is None:
+                self._free.put(worker)
+                return
+        self._loop.call_soon_threadsafe(self._free_async.put_nowait, worker)
+
+    def _close_worker(self, worker):
+        # Quitting the driver and stopping Appium block, so keep them off the loop
+        with self._lock:
+            loop = self._loop
+        if loop is None:
+            super()._close_worker(worker)
+        else:
+            loop.run_in_executor(None, super()._close_worker, worker)
+
+    async def _dwell(self, loop, executor, worker, result):
+        """Keeps the app open for the dwell without holding a thread."""
+        session = self.session_pool.get(worker)
+        package = result['dwell']['package']
+        seconds = result['dwell']['seconds']
+        logging.info(f"Waiting {seconds / 60:g} minutes on {worker.get('device_id')}...")
+
+        dwell_started = time.time()
+        deadline = loop.time() + clock.dwell_seconds(seconds)
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            await asyncio.sleep(min(WAIT_SETTINGS['dwell_check_seconds'], remaining))
+            await loop.run_in_executor(executor, ensure_foreground, session.driver, package)
+
+        await loop.run_in_executor(executor, finish_automation, session, result)
+        add_deferred_phase(result.get('profile'), 'dwell', dwell_started, time.time() - dwell_started)
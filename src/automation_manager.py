@@ -1,7 +1,6 @@
 #!/usr/bin/env python
 
 import time
-import os
 import logging
 from appium import webdriver
 from appium.options.android import UiAutomator2Options
@@ -10,16 +9,58 @@ from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import TimeoutException, NoSuchElementException
 
+from src.action_plan import compile_plan
+from src.apk_cache import find_cached_apk, install_apk
+from src.artifacts import get_collector
+from src.gestures import type_into
+from src.page_snapshot import page_snapshot
+from src.profiler import profiled, timed_phase, record_wait
+from src.selector_sets import SelectorSet, click_first, ALREADY_DONE
+from src.waits import (
+    WAIT_SETTINGS, wait_for_page_load, wait_for_url_change, wait_for_invisible,
+    wait_for_package_installed, wait_for_app_foreground, dwell_in_app,
+)
+
 CHROME_PACKAGE = 'com.android.chrome'
 PLAY_STORE_PACKAGE = 'com.android.vending'
 
-def get_appium_driver(emulator_name, appium_port=4723):
+JOIN_BUTTONS = SelectorSet('join group', [
+    '//button[contains(text(),"Join group")]',
+    '//button[contains(text(),"Ask to join")]',
+    '//span[contains(text(),"Join group")]/ancestor::button',
+    '//span[contains(text(),"Ask to join")]/ancestor::button',
+    '//*[contains(@aria-label,"Join")]',
+])
+
+BETA_ACCEPT_BUTTONS = SelectorSet('become tester', [
+    '//button[contains(text(),"Become a tester")]',
+    '//button[contains(text(),"Accept")]',
+    '//span[contains(text(),"Become a tester")]/ancestor::button',
+    '//a[contains(text(),"Become a tester")]',
+    '//*[contains(text(),"Become a tester")]',
+    '//button[contains(@class,"tester")]',
+])
+
+INSTALL_BUTTONS = SelectorSet('install', [
+    '//button[contains(text(),"Install")]',
+    '//span[contains(text(),"Install")]/ancestor::button',
+    '//*[contains(@aria-label,"Install")]',
+])
+
+@profiled
+def get_appium_driver(emulator_name, appium_port=4723, system_port=None, chromedriver_port=None):
     options = UiAutomator2Options()
     options.platform_name = 'Android'
     options.device_name = emulator_name
+    options.udid = emulator_name
     options.automation_name = 'UiAutomator2'
     options.no_reset = True
     options.full_reset = False
+    # Host ports of the session; distinct per device when several run in parallel
+    if system_port:
+        options.system_port = system_port
+    if chromedriver_port:
+        options.chromedriver_port = chromedriver_port
     
     try:
         driver = webdriver.Remote(f'http://127.0.0.1:{appium_port}', options=options)
@@ -29,23 +70,10 @@ def get_appium_driver(emulator_name, appium_port=4723):
         logging.error(f"Driver init failed: {e}")
         return None
 
-def get_chrome_driver(emulator_name, appium_port=4723):
-    options = UiAutomator2Options()
-    options.platform_name = 'Android'
-    options.device_name = emulator_name
-    options.automation_name = 'UiAutomator2'
-    options.browser_name = 'Chrome'
-    options.no_reset = True
-    
-    try:
-        driver = webdriver.Remote(f'http://127.0.0.1:{appium_port}', options=options)
-        logging.info(f"Chrome driver initialized for {emulator_name}:{appium_port}")
-        return driver
-    except Exception as e:
-        logging.error(f"Chrome driver init failed: {e}")
-        return None
-
-def wait_and_find(driver, by, value, timeout=15):
+def wait_and_find(driver, by, value, timeout=None):
+    if timeout is None:
+        timeout = WAIT_SETTINGS['timeout_seconds']
+    started = time.monotonic()
     try:
         element = WebDriverWait(driver, timeout).until(
             EC.presence_of_element_located((by, value))
@@ -53,29 +81,29 @@ def wait_and_find(driver, by, value, timeout=15):
         return element
     except TimeoutException:
         return None
+    finally:
+        record_wait(time.monotonic() - started)
 
-def wait_and_click(driver, by, value, timeout=15):
+def wait_and_click(driver, by, value, timeout=None):
+    if timeout is None:
+        timeout = WAIT_SETTINGS['timeout_seconds']
+    started = time.monotonic()
     try:
         element = WebDriverWait(driver, timeout).until(
             EC.element_to_be_clickable((by, value))
         )
-        element.click()
-        return True
     except TimeoutException:
         return False
+    finally:
+        record_wait(time.monotonic() - started)
+    element.click()
+    return True
 
-def safe_click(driver, by, value):
-    try:
-        el = driver.find_element(by, value)
-        el.click()
-        return True
-    except:
-        return False
-
+@profiled
 def google_login(driver, email, password):
     logging.info(f"Logging in as {email}")
     driver.get('https://accounts.google.com/signin')
-    time.sleep(3)
+    wait_for_page_load(driver)
     
     email_field = wait_and_find(driver, AppiumBy.XPATH, '//input[@type="email"]')
     if not email_field:
@@ -84,13 +112,10 @@ def google_login(driver, email, password):
         logging.error("Email field not found")
         return False
     
-    email_field.clear()
-    email_field.send_keys(email)
-    time.sleep(1)
+    type_into(driver, email_field, email)
     
     if not wait_and_click(driver, AppiumBy.XPATH, '//button[contains(@class,"VfPpkd")]//span[text()="Next"]/ancestor::button'):
         wait_and_click(driver, AppiumBy.ID, 'identifierNext')
-    time.sleep(3)
     
     password_field = wait_and_find(driver, AppiumBy.XPATH, '//input[@type="password"]')
     if not password_field:
@@ -99,185 +124,166 @@ def google_login(driver, email, password):
         logging.error("Password field not found")
         return False
     
-    password_field.clear()
-    password_field.send_keys(password)
-    time.sleep(1)
+    type_into(driver, password_field, password)
     
+    password_url = driver.current_url
     if not wait_and_click(driver, AppiumBy.XPATH, '//button[contains(@class,"VfPpkd")]//span[text()="Next"]/ancestor::button'):
         wait_and_click(driver, AppiumBy.ID, 'passwordNext')
-    time.sleep(5)
+    wait_for_url_change(driver, password_url)
     
     logging.info("Login submitted")
     return True
 
+@profiled
 def join_google_group(driver, group_link):
     logging.info(f"Joining group: {group_link}")
     driver.get(group_link)
-    time.sleep(5)
+    wait_for_page_load(driver)
     
-    join_xpaths = [
-        '//button[contains(text(),"Join group")]',
-        '//button[contains(text(),"Ask to join")]',
-        '//span[contains(text(),"Join group")]/ancestor::button',
-        '//span[contains(text(),"Ask to join")]/ancestor::button',
-        '//*[contains(@aria-label,"Join")]',
-    ]
-    
-    for xpath in join_xpaths:
-        if wait_and_click(driver, AppiumBy.XPATH, xpath, timeout=3):
-            logging.info("Clicked join button")
-            time.sleep(3)
-            return True
+    clicked = click_first(driver, JOIN_BUTTONS, done_texts=['you are a member', 'leave group'])
+    if clicked and clicked != ALREADY_DONE:
+        logging.info("Clicked join button")
+        wait_for_invisible(driver, AppiumBy.XPATH, clicked)
+        return True
     
-    if 'you are a member' in driver.page_source.lower() or 'leave group' in driver.page_source.lower():
+    if page_snapshot(driver).contains_any('you are a member', 'leave group'):
         logging.info("Already a member")
         return True
     
     logging.warning("Join button not found")
     return False
 
+@profiled
 def accept_beta(driver, beta_link):
     logging.info(f"Accepting beta: {beta_link}")
     driver.get(beta_link)
-    time.sleep(5)
+    wait_for_page_load(driver)
     
-    accept_xpaths = [
-        '//button[contains(text(),"Become a tester")]',
-        '//button[contains(text(),"Accept")]',
-        '//span[contains(text(),"Become a tester")]/ancestor::button',
-        '//a[contains(text(),"Become a tester")]',
-        '//*[contains(text(),"Become a tester")]',
-        '//button[contains(@class,"tester")]',
-    ]
-    
-    for xpath in accept_xpaths:
-        if wait_and_click(driver, AppiumBy.XPATH, xpath, timeout=3):
-            logging.info("Clicked become tester")
-            time.sleep(3)
-            return True
+    clicked = click_first(driver, BETA_ACCEPT_BUTTONS, done_texts=["you're a tester", 'leave the program'])
+    if clicked and clicked != ALREADY_DONE:
+        logging.info("Clicked become tester")
+        wait_for_invisible(driver, AppiumBy.XPATH, clicked)
+        return True
     
-    if "you're a tester" in driver.page_source.lower() or 'leave the program' in driver.page_source.lower():
+    if page_snapshot(driver).contains_any("you're a tester", 'leave the program'):
         logging.info("Already a tester")
         return True
     
     logging.warning("Beta accept button not found")
     return False
 
+@profiled
+def install_app(session, driver, app_package, config):
+    """Makes sure app_package is on the device: skips if installed, else uses the APK cache or the Play Store."""
+    if driver.is_app_installed(app_package):
+        logging.info(f"{app_package} already installed, skipping install")
+        return True
+    
+    apk_path = find_cached_apk(config.get('apk_cache_dir'), app_package)
+    if apk_path and install_apk(config.get('android_sdk_path', ''), session.device_id, apk_path, app_package):
+        return True
+    
+    return install_from_playstore(driver, app_package)
+
+@profiled
 def install_from_playstore(driver, app_package):
     logging.info(f"Installing {app_package} from Play Store")
     
     playstore_url = f'https://play.google.com/store/apps/details?id={app_package}'
     driver.get(playstore_url)
-    time.sleep(5)
+    wait_for_page_load(driver)
     
-    install_xpaths = [
-        '//button[contains(text(),"Install")]',
-        '//span[contains(text(),"Install")]/ancestor::button',
-        '//*[contains(@aria-label,"Install")]',
-    ]
-    
-    for xpath in install_xpaths:
-        if wait_and_click(driver, AppiumBy.XPATH, xpath, timeout=3):
-            logging.info("Clicked install")
-            time.sleep(30)
-            return True
+    clicked = click_first(driver, INSTALL_BUTTONS, done_texts=['uninstall'])
+    if clicked and clicked != ALREADY_DONE:
+        logging.info("Clicked install")
+        if not wait_for_package_installed(driver, app_package):
+            logging.warning(f"{app_package} did not finish installing in time")
+            return False
+        return True
     
-    if 'uninstall' in driver.page_source.lower() or 'open' in driver.page_source.lower():
+    # Trust the package manager, not the store page
+    if driver.is_app_installed(app_package):
         logging.info("App already installed")
         return True
     
     logging.warning("Install button not found")
     return False
 
-def open_app_and_interact(driver, app_package, actions):
+@profiled
+def open_app_and_interact(driver, app_package, plan):
     logging.info(f"Opening app: {app_package}")
     
     try:
         driver.activate_app(app_package)
-        time.sleep(5)
+        if not wait_for_app_foreground(driver, app_package):
+            logging.warning(f"{app_package} did not reach the foreground")
     except Exception as e:
         logging.error(f"Failed to activate app: {e}")
         return False
     
-    for action in actions:
-        action_type = action.get('type')
-        desc = action.get('description', action_type)
-        logging.info(f"Action: {desc}")
-        
-        try:
-            if action_type == 'click':
-                element_id = action.get('element_id')
-                xpath = action.get('xpath')
-                text = action.get('text')
-                
-                if element_id:
-                    safe_click(driver, AppiumBy.ID, element_id)
-                elif xpath:
-                    safe_click(driver, AppiumBy.XPATH, xpath)
-                elif text:
-                    safe_click(driver, AppiumBy.XPATH, f'//*[contains(@text,"{text}")]')
-                time.sleep(2)
-                
-            elif action_type == 'wait':
-                duration = action.get('duration_seconds', 5)
-                time.sleep(duration)
-                
-            elif action_type == 'scroll':
-                driver.swipe(500, 1500, 500, 500, 1000)
-                time.sleep(1)
-                
-            elif action_type == 'back':
-                driver.back()
-                time.sleep(1)
-                
-        except Exception as e:
-            logging.warning(f"Action failed: {e}")
-            continue
+    plan.run(driver)
     
     return True
 
-def run_automation(driver, email, password, group_link, beta_link, config, result_details):
-    chrome_driver = None
+def run_automation(session, email, password, group_link, beta_link, config, result_details, defer_dwell=False):
+    """Runs the phases of one account, skipping those result_details['phases'] already marks as done.
+
+    Each phase is marked 'failed' while it runs and 'done' once it succeeds,
+    so a retry or a resumed run can pick up at the phase that failed. A step
+    that returns False fails the account like an element timeout.
+    """
+    driver = None
+    phases = result_details.setdefault('phases', {})
+    
+    def run_phase(name, step):
+        if phases.get(name) == 'done':
+            logging.info(f"Skipping {name}, already done")
+            return
+        phases[name] = 'failed'
+        if step() is False:
+            raise TimeoutException(f"{name} did not complete")
+        phases[name] = 'done'
+    
+    def login():
+        if not google_login(driver, email, password):
+            raise TimeoutException("Login failed: sign-in fields not found")
     
     try:
         logging.info(f"Starting automation for {email}")
         
-        device_id = driver.capabilities.get('deviceName', 'unknown')
-        appium_url = driver.command_executor._url
-        port = int(appium_url.split(':')[-1].split('/')[0]) if appium_url else 4723
-        
-        driver.quit()
-        
-        chrome_driver = get_chrome_driver(device_id, port)
-        if not chrome_driver:
-            raise RuntimeError("Failed to init Chrome driver")
+        app_package = config.get('automation_steps', {}).get('app_package')
+        web_phases = ['login', 'join_group', 'accept_beta'] + (['install'] if app_package else [])
+        if any(phases.get(name) != 'done' for name in web_phases):
+            with timed_phase('chrome_context'):
+                driver = session.web()
         
-        if not google_login(chrome_driver, email, password):
-            raise RuntimeError("Login failed")
+        run_phase('login', login)
         
         if group_link and group_link.strip():
-            join_google_group(chrome_driver, group_link)
+            run_phase('join_group', lambda: join_google_group(driver, group_link))
         
         if beta_link and beta_link.strip():
-            accept_beta(chrome_driver, beta_link)
+            run_phase('accept_beta', lambda: accept_beta(driver, beta_link))
         
-        app_package = config.get('automation_steps', {}).get('app_package')
         if app_package:
-            install_from_playstore(chrome_driver, app_package)
-        
-        chrome_driver.quit()
-        chrome_driver = None
-        
-        app_driver = get_appium_driver(device_id, port)
-        if app_driver and app_package:
-            actions = config.get('automation_steps', {}).get('actions', [])
-            open_app_and_interact(app_driver, app_package, actions)
+            run_phase('install', lambda: install_app(session, driver, app_package, config))
             
-            wait_minutes = config.get('wait_minutes', 10)
-            logging.info(f"Waiting {wait_minutes} minutes...")
-            time.sleep(wait_minutes * 60)
+            with timed_phase('native_context'):
+                driver = session.native()
+            plan = config.get('action_plan') or compile_plan(config.get('automation_steps', {}).get('actions'))
+            run_phase('interact', lambda: open_app_and_interact(driver, app_package, plan))
             
-            app_driver.quit()
+            wait_minutes = config.get('wait_minutes', 10)
+            if defer_dwell:
+                # The caller keeps the app open and calls finish_automation afterwards
+                result_details['dwell'] = {'package': app_package, 'seconds': wait_minutes * 60}
+            else:
+                def dwell():
+                    logging.info(f"Waiting {wait_minutes} minutes...")
+                    with timed_phase('dwell'):
+                        dwell_in_app(driver, app_package, wait_minutes * 60)
+                    driver.terminate_app(app_package)
+                run_phase('dwell', dwell)
         
         result_details['status'] = 'Success'
         result_details['details'] = 'Completed'
@@ -286,25 +292,27 @@ def run_automation(driver, email, password, group_link, beta_link, config, resul
     except Exception as e:
         logging.error(f"Automation failed: {e}")
         result_details['details'] = str(e)
-        
-        screenshots_dir = 'screenshots'
-        os.makedirs(screenshots_dir, exist_ok=True)
-        timestamp = time.strftime("%Y%m%d-%H%M%S")
-        screenshot_path = os.path.join(screenshots_dir, f"fail_{email}_{timestamp}.png")
-        
-        active_driver = chrome_driver if chrome_driver else driver
-        try:
-            if active_driver:
-                active_driver.save_screenshot(screenshot_path)
-                result_details['screenshot_path'] = screenshot_path
-        except:
-            pass
-        
         raise
-    
-    finally:
-        if chrome_driver:
-            try:
-                chrome_driver.quit()
-            except:
-                pass
+
+def capture_failure(session, device_id, email, result_details):
+    """Saves screenshot, page source and logcat for a failed account into result_details.
+
+    Called once the caller gives up on the device, not after every attempt.
+    """
+    driver = session.driver if session else None
+    artifacts = get_collector().capture(driver, device_id, f"fail_{email}")
+    result_details['screenshot_path'] = artifacts.get('screenshot')
+    result_details['artifacts'] = artifacts
+
+def finish_automation(session, result_details):
+    """Closes the app after a deferred dwell and records the outcome."""
+    dwell = result_details.pop('dwell', None)
+    if not dwell:
+        return
+    try:
+        session.native().terminate_app(dwell['package'])
+        result_details.setdefault('phases', {})['dwell'] = 'done'
+    except Exception as e:
+        logging.error(f"Failed to close {dwell['package']} after dwell: {e}")
+        result_details['status'] = 'Failure'
+        result_details['details'] = str(e)
@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+
+"""Append-only JSONL checkpoint of finished rows, used to resume an interrupted run."""
+
+import json
+import logging
+import os
+import threading
+
+from src.accounts_reader import row_key
+
+class Checkpoint:
+    """Appends each result as one JSON line as soon as its row finishes."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def start_fresh(self):
+        """Moves the previous run's checkpoint aside so a new run starts empty."""
+        if os.path.exists(self.path):
+            os.replace(self.path, self.path + '.prev')
+
+    def append(self, result):
+        line = json.dumps(result, default=str)
+        with self._lock:
+            with open(self.path, 'a') as f:
+                f.write(line + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+
+    def load(self):
+        """Returns the latest record for each row key. A truncated last line is ignored."""
+        records = {}
+        if not os.path.exists(self.path):
+            return records
+        with open(self.path, 'r') as f:
+            for line_number, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    logging.warning(f"Skipping unreadable checkpoint line {line_number} in {self.path}")
+                    continue
+                records[row_key(record.get('row_index'), record.get('email', ''))] = record
+        return records
+
+    def completed_keys(self, records=None):
+        """Returns the keys of rows whose latest record is a success, from records if already loaded."""
+        records = self.load() if records is None else records
+        return {key for key, record in records.items() if record.get('status') == 'Success'}
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+
+"""Injectable clock that every sleep and timeout goes through.
+
+Two kinds of waiting are kept apart. Polling (selector waits, readiness
+checks) always runs in real time because the device answers in real time.
+Intentional dwell (wait_minutes, "wait" actions) can be compressed for
+rehearsals and dry runs.
+"""
+
+import logging
+import threading
+import time
+
+class Clock:
+    """Real time: dwell lasts as long as requested."""
+
+    def monotonic(self):
+        return time.monotonic()
+
+    def sleep(self, seconds):
+        """Real sleep, used between polls."""
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def dwell_seconds(self, seconds):
+        """Returns how many real seconds an intentional wait of the given length should take."""
+        return seconds
+
+    def dwell(self, seconds):
+        self.sleep(self.dwell_seconds(seconds))
+
+    def describe(self):
+        return 'real time'
+
+class ScaledClock(Clock):
+    """Compresses intentional dwell by a constant factor."""
+
+    def __init__(self, factor):
+        if factor <= 0:
+            raise ValueError(f"Clock scale must be positive, got {factor}")
+        self.factor = factor
+
+    def dwell_seconds(self, seconds):
+        return seconds / self.factor
+
+    def describe(self):
+        return f'dwell compressed {self.factor:g}x'
+
+class VirtualClock(Clock):
+    """Skips intentional dwell entirely and keeps count of the time skipped."""
+
+    def __init__(self):
+        self.skipped_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def dwell_seconds(self, seconds):
+        with self._lock:
+            self.skipped_seconds += seconds
+        return 0
+
+    def describe(self):
+        return 'virtual dwell (dry run)'
+
+_clock = Clock()
+
+def get_clock():
+    return _clock
+
+def set_clock(clock):
+    global _clock
+    _clock = clock
+    logging.info(f"Clock: {clock.describe()}")
+
+def configure_clock(config, dry_run=False, time_scale=None):
+    """Installs the clock selected by the command line or the "clock" section of the config."""
+    settings = config.get('clock', {})
+    mode = settings.get('mode', 'real')
+    if dry_run:
+        mode = 'virtual'
+    elif time_scale:
+        mode = 'scaled'
+    if mode == 'virtual':
+        set_clock(VirtualClock())
+    elif mode == 'scaled':
+        set_clock(ScaledClock(time_scale or settings.get('scale', 60)))
+    elif mode == 'real':
+        set_clock(Clock())
+    else:
+        raise ValueError(f"Unknown clock mode: {mode}")
+
+def monotonic():
+    return _clock.monotonic()
+
+def sleep(seconds):
+    _clock.sleep(seconds)
+
+def dwell_seconds(seconds):
+    return _clock.dwell_seconds(seconds)
+
+def dwell(seconds):
+    _clock.dwell(seconds)
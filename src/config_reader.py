@@ -10,6 +10,24 @@ def read_config():
         logging.error("Configuration file 'config.json' not found.")
         return {}
 
+def validate_workers(config):
+    """Checks parallel_workers and returns it. Raises ValueError naming the bad entry."""
+    workers = config.get('parallel_workers')
+    if not isinstance(workers, list):
+        raise ValueError("parallel_workers must be a list")
+    seen = set()
+    for i, worker in enumerate(workers):
+        where = f"parallel_workers[{i}]"
+        if not isinstance(worker, dict):
+            raise ValueError(f"{where} must be an object")
+        device_id = worker.get('device_id')
+        if not isinstance(device_id, str) or not device_id:
+            raise ValueError(f"{where}: device_id must be a non-empty string")
+        if device_id in seen:
+            raise ValueError(f"{where}: {device_id} is listed twice")
+        seen.add(device_id)
+    return workers
+
 if __name__ == '__main__':
     # This is for testing purposes.
     from logger_setup import setup_logger
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+
+"""Watches config.json during a run and applies changes to parallel_workers.
+
+The file is polled for a new modification time. A changed file is parsed
+and validated first; if it is broken the change is logged and ignored, and
+the run carries on with the devices it has.
+"""
+
+import json
+import logging
+import os
+import threading
+
+from src.config_reader import validate_workers
+
+class ConfigWatcher:
+    """Calls on_workers(parallel_workers) from a background thread whenever the config file changes."""
+
+    def __init__(self, path, on_workers, interval=2.0):
+        self.path = path
+        self.on_workers = on_workers
+        self.interval = interval
+        self._mtime = self._modified()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='config-watcher', daemon=True)
+
+    def start(self):
+        logging.info(f"Watching {self.path} for worker changes")
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def _modified(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                logging.error(f"Applying config change failed: {e}")
+
+    def check(self):
+        """Applies the config if it changed since the last check. Returns True if it was applied."""
+        mtime = self._modified()
+        if mtime is None or mtime == self._mtime:
+            return False
+        self._mtime = mtime
+        try:
+            with open(self.path, 'r') as f:
+                workers = validate_workers(json.load(f))
+        except (OSError, ValueError) as e:
+            logging.error(f"Ignoring change to {self.path}: {e}")
+            return False
+        logging.info(f"{self.path} changed, {len(workers)} workers configured")
+        self.on_workers(workers)
+        return True
@@ -0,0 +1,331 @@
+#!/usr/bin/env python
+
+"""Splits a run into shards and dispatches them to worker processes over a local socket."""
+
+import ipaddress
+import itertools
+import json
+import logging
+import os
+import secrets
+import socket
+import subprocess
+import sys
+import threading
+from collections import deque
+from multiprocessing.connection import Listener, Client
+
+MAIN_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'main.py')
+
+# Environment variable that carries the authkey, so it never shows up in the process list
+AUTHKEY_ENV = 'AUTOMATION_AUTHKEY'
+
+def get_coordinator_settings(config):
+    """Returns the coordinator section of the config with defaults filled in.
+
+    The authkey comes from AUTOMATION_AUTHKEY if set, else from the config;
+    there is no default.
+    """
+    settings = {
+        'host': '127.0.0.1',
+        'port': 6100,
+        'authkey': None,
+        'local_processes': 2,
+        'shard_size': 10,
+    }
+    settings.update(config.get('coordinator', {}))
+    settings['authkey'] = os.environ.get(AUTHKEY_ENV) or settings['authkey']
+    return settings
+
+def is_loopback(host):
+    try:
+        return ipaddress.ip_address(socket.gethostbyname(host)).is_loopback
+    except (OSError, ValueError):
+        return False
+
+def check_coordinator_settings(settings):
+    """Raises ValueError if the coordinator would accept connections from other hosts without an authkey.
+
+    Connections carry pickled data, so a peer that knows the key can run code here.
+    """
+    if not settings['authkey'] and not is_loopback(settings['host']):
+        raise ValueError(
+            f"coordinator.host {settings['host']} accepts other machines; "
+            f"set coordinator.authkey or {AUTHKEY_ENV}"
+        )
+
+def split_devices(workers, count):
+    """Splits the device list into count non-empty groups."""
+    count = max(1, min(count, len(workers)))
+    return [workers[i::count] for i in range(count)]
+
+class Coordinator:
+    """Hands out shards of indexed rows to workers and merges their results.
+
+    Workers pull a shard when they are ready, so faster workers take more
+    shards. Shards held by a worker that disconnects go back on the queue.
+    """
+
+    def __init__(self, rows, shard_size, on_result=None):
+        self._rows = iter(rows)
+        self.shard_size = shard_size
+        self.on_result = on_result
+        self.requeued = []
+        self.exhausted = False
+        self.outstanding = 0
+        self.connections = 0
+        self.merged = 0
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+
+    def _next_shard(self):
+        """Returns the next shard, cutting it from the row stream only when a worker asks."""
+        with self._lock:
+            if self.requeued:
+                shard = self.requeued.pop(0)
+            else:
+                shard = list(itertools.islice(self._rows, self.shard_size))
+                if not shard:
+                    self.exhausted = True
+                    self._check_done()
+                    return None
+            self.outstanding += 1
+            return shard
+
+    def _check_done(self):
+        if self.exhausted and not self.requeued and not self.outstanding:
+            self._done.set()
+
+    def _finish_shard(self, results):
+        if self.on_result:
+            for result in results:
+                self.on_result(result)
+        with self._lock:
+            self.merged += len(results)
+            self.outstanding -= 1
+            self._check_done()
+
+    def _requeue_shard(self, shard):
+        with self._lock:
+            self.requeued.append(shard)
+            self.outstanding -= 1
+
+    def serve(self, conn):
+        """Serves one worker connection until there is no work left.
+
+        A worker may hold several shards at once, so it can fetch the next
+        one while the last is still running; each is tagged with an id.
+        """
+        shards = {}
+        shard_ids = itertools.count()
+        finished = False
+        name = 'unknown'
+        with self._lock:
+            self.connections += 1
+        try:
+            kind, payload = conn.recv()
+            if kind == 'hello':
+                name = payload.get('name', name)
+                logging.info(f"Worker {name} connected with {len(payload.get('devices', []))} devices")
+            while not (finished and not shards):
+                kind, payload = conn.recv()
+                if kind == 'results':
+                    shard_id, results = payload
+                    shards.pop(shard_id, None)
+                    self._finish_shard(results)
+                    logging.info(f"Worker {name} finished a shard ({self.merged} results merged)")
+                elif kind == 'ready':
+                    shard = self._next_shard()
+                    if shard is None:
+                        conn.send(('done', None))
+                        finished = True
+                        continue
+                    shard_id = next(shard_ids)
+                    shards[shard_id] = shard
+                    conn.send(('rows', (shard_id, shard)))
+        except (EOFError, OSError) as e:
+            logging.error(f"Worker {name} disconnected: {e}")
+        finally:
+            for shard in shards.values():
+                logging.warning(f"Requeueing shard of {len(shard)} rows from {name}")
+                self._requeue_shard(shard)
+            with self._lock:
+                self.connections -= 1
+            conn.close()
+
+    def fail_remaining(self, fail_fn, details):
+        """Reports every row no worker is left to run through fail_fn(row, details) and on_result."""
+        with self._lock:
+            shards, self.requeued = self.requeued, []
+            self.exhausted = True
+        failed = 0
+        for row in itertools.chain(itertools.chain.from_iterable(shards), self._rows):
+            if self.on_result:
+                self.on_result(fail_fn(row, details))
+            failed += 1
+        return failed
+
+    def wait(self, processes):
+        """Waits until every shard is merged, or until no worker is left to run them.
+
+        Returns False if the local workers all exited and nobody is connected.
+        """
+        while not self._done.wait(timeout=1):
+            if processes and all(p.poll() is not None for p in processes) and not self.connections:
+                return False
+        return True
+
+def spawn_local_worker(address, authkey, devices, extra_args=()):
+    """Starts a worker process for the given devices on this machine."""
+    command = [
+        sys.executable, MAIN_SCRIPT,
+        '--worker', f'{address[0]}:{address[1]}',
+        '--worker-devices', json.dumps(devices),
+        *extra_args,
+    ]
+    return subprocess.Popen(command, cwd=os.getcwd(), env=dict(os.environ, **{AUTHKEY_ENV: authkey}))
+
+def run_coordinator(config, rows, workers, on_result, worker_args=(), fail_fn=None):
+    """Runs the rows across local and remote worker processes, passing each merged result to on_result.
+
+    worker_args are extra command-line arguments for the local worker processes.
+    If the workers all exit early, fail_fn(row, details), if given, turns the
+    rows they left into failure results.
+    """
+    settings = get_coordinator_settings(config)
+    check_coordinator_settings(settings)
+    address = (settings['host'], settings['port'])
+    # Without a configured key only local workers can connect, so any key will do
+    authkey = settings['authkey'] or secrets.token_hex(16)
+    coordinator = Coordinator(rows, settings['shard_size'], on_result)
+
+    listener = Listener(address, authkey=authkey.encode())
+    logging.info(f"Coordinator listening on {address[0]}:{address[1]}")
+
+    def accept_loop():
+        while True:
+            try:
+                conn = listener.accept()
+            except OSError:
+                return
+            except Exception as e:
+                logging.error(f"Rejected worker connection: {e}")
+                continue
+            threading.Thread(target=coordinator.serve, args=(conn,), daemon=True).start()
+
+    threading.Thread(target=accept_loop, daemon=True).start()
+
+    processes = []
+    if settings['local_processes'] and workers:
+        for devices in split_devices(workers, settings['local_processes']):
+            processes.append(spawn_local_worker(address, authkey, devices, worker_args))
+        logging.info(f"Started {len(processes)} local worker processes")
+
+    try:
+        if not coordinator.wait(processes):
+            logging.error(f"All local workers exited before the run finished ({coordinator.merged} rows merged)")
+            if fail_fn:
+                failed = coordinator.fail_remaining(fail_fn, 'No worker available')
+                logging.error(f"{failed} remaining rows reported as failed")
+    finally:
+        listener.close()
+        for process in processes:
+            process.wait()
+
+class WorkerFeed:
+    """Feeds a worker's scheduler from the coordinator, one shard ahead.
+
+    rows() yields rows as the scheduler asks for them and sends 'ready' as
+    soon as fewer than low_water rows are left locally, so the next shard
+    arrives while the current one is still running. on_result() collects
+    results per shard and sends each shard back once all of its rows are in.
+    """
+
+    def __init__(self, conn, low_water):
+        self.conn = conn
+        self.low_water = low_water
+        self._rows = deque()
+        self._shards = {}
+        self._shard_of = {}
+        self._requested = False
+        self._done = False
+        self._cond = threading.Condition()
+        self._send_lock = threading.Lock()
+
+    def _send(self, message):
+        with self._send_lock:
+            self.conn.send(message)
+
+    def _request(self):
+        """Asks for the next shard unless a request is already out. Call with _cond held."""
+        if not self._requested and not self._done:
+            self._requested = True
+            self._send(('ready', None))
+
+    def receive(self):
+        """Reads shards from the coordinator until it says done or disconnects."""
+        try:
+            while True:
+                kind, payload = self.conn.recv()
+                with self._cond:
+                    self._requested = False
+                    if kind == 'done':
+                        self._done = True
+                    else:
+                        shard_id, shard = payload
+                        logging.info(f"Received a shard of {len(shard)} rows")
+                        self._shards[shard_id] = []
+                        for row in shard:
+                            self._shard_of[row[0]] = (shard_id, len(shard))
+                            self._rows.append(row)
+                    self._cond.notify_all()
+                if kind == 'done':
+                    return
+        except (EOFError, OSError) as e:
+            logging.error(f"Lost the coordinator: {e}")
+            with self._cond:
+                self._done = True
+                self._cond.notify_all()
+
+    def rows(self):
+        while True:
+            with self._cond:
+                while not self._rows and not self._done:
+                    self._request()
+                    self._cond.wait()
+                if not self._rows:
+                    return
+                row = self._rows.popleft()
+                if len(self._rows) < self.low_water:
+                    self._request()
+            yield row
+
+    def on_result(self, result):
+        with self._cond:
+            shard_id, size = self._shard_of.pop(result.get('row_index'), (None, 0))
+            if shard_id is None:
+                return
+            results = self._shards[shard_id]
+            results.append(result)
+            if len(results) < size:
+                return
+            del self._shards[shard_id]
+        self._send(('results', (shard_id, results)))
+
+def run_worker(address, authkey, devices, run_rows):
+    """Connects to a coordinator and runs its shards on the given devices until it says done.
+
+    run_rows(rows, devices, on_result) is called once, so the devices keep
+    one scheduler, and their sessions, for the whole run.
+    """
+    conn = Client(address, authkey=authkey.encode())
+    name = f"{socket.gethostname()}:{os.getpid()}"
+    logging.info(f"Worker {name} connected to coordinator at {address[0]}:{address[1]}")
+    feed = WorkerFeed(conn, max(1, len(devices)))
+    try:
+        conn.send(('hello', {'name': name, 'devices': [d.get('device_id') for d in devices]}))
+        receiver = threading.Thread(target=feed.receive, name='coordinator-feed', daemon=True)
+        receiver.start()
+        run_rows(feed.rows(), devices, feed.on_result)
+    finally:
+        conn.close()
@@ -1,6 +1,13 @@
+import asyncio
 import subprocess
 import os
 import logging
+import threading
+import time
+from collections import defaultdict
+
+from src.adb_client import AdbError, emulator_console, get_adb_client
+from src.waits import wait_until
 
 def get_emulator_path(sdk_path):
     """Gets the path to the emulator executable."""
@@ -25,47 +32,238 @@ def get_adb_path(sdk_path):
     """Gets the path to the adb executable."""
     return os.path.join(sdk_path, 'platform-tools', 'adb')
 
-def start_emulator(sdk_path, emulator_name):
-    """Starts a given Android emulator."""
+def ensure_adb_server(sdk_path):
+    """Starts the adb server with `adb start-server` unless it already answers. Returns True if it is up.
+
+    Boot and reset checks talk to the server's socket only, so on a fresh
+    host they would wait out their whole timeout without it.
+    """
+    client = get_adb_client()
+    if client.is_available():
+        return True
+    logging.info("adb server not running, starting it...")
+    try:
+        subprocess.run(
+            [get_adb_path(sdk_path), 'start-server'], capture_output=True, timeout=30,
+            env=dict(os.environ, ANDROID_ADB_SERVER_PORT=str(client.port)),
+        )
+    except (FileNotFoundError, subprocess.TimeoutExpired) as e:
+        logging.error(f"Could not start the adb server: {e}")
+        return False
+    if not client.is_available():
+        logging.error(f"adb server still not reachable on {client.host}:{client.port}")
+        return False
+    return True
+
+def start_emulator(sdk_path, emulator_name, port=None, extra_args=None):
+    """Starts a given Android emulator.
+
+    With a console port the emulator comes up as emulator-<port>. Returns the
+    emulator process, or None if it could not be started.
+    """
     emulator_path = get_emulator_path(sdk_path)
     logging.info(f"Starting emulator: {emulator_name}...")
+    command = [emulator_path, '-avd', emulator_name, '-no-snapshot-load']
+    if port:
+        command += ['-port', str(port)]
+    command += list(extra_args or [])
     try:
-        subprocess.Popen([emulator_path, '-avd', emulator_name, '-no-snapshot-load'])
+        process = subprocess.Popen(command)
         logging.info(f"Emulator {emulator_name} is starting.")
-        return True
+        return process
     except FileNotFoundError:
         logging.error(f"'emulator.exe' not found at {emulator_path}.")
+        return None
+
+def is_boot_completed(device_id):
+    try:
+        return get_adb_client().getprop(device_id, 'sys.boot_completed') == '1'
+    except AdbError:
         return False
 
-def get_running_devices(sdk_path):
-    """Returns a list of running emulator device IDs."""
+def wait_for_boot(device_id, timeout=300, process=None):
+    """Polls sys.boot_completed with backoff until the device has booted.
+
+    Gives up early if the emulator process exits. Returns True once booted.
+    """
+    exited = lambda: process is not None and process.poll() is not None
+    wait_until(lambda: exited() or is_boot_completed(device_id), timeout=timeout,
+               description=f'{device_id} to boot')
+    if exited():
+        logging.error(f"Emulator for {device_id} exited with code {process.returncode} before booting")
+        return False
+    return is_boot_completed(device_id)
+
+def get_running_devices(sdk_path, emulators_only=True):
+    """Returns a list of running emulator device IDs.
+
+    Asks the adb server over its socket, and only spawns adb if the server
+    cannot be reached.
+    """
+    try:
+        return get_adb_client().device_ids(emulators_only)
+    except AdbError as e:
+        logging.debug(f"adb server query failed, falling back to adb: {e}")
     adb_path = get_adb_path(sdk_path)
     try:
         result = subprocess.run([adb_path, 'devices'], capture_output=True, text=True, check=True)
-        devices = result.stdout.strip().split('\n')[1:]
-        device_ids = [line.split('\t')[0] for line in devices if 'emulator' in line]
-        return device_ids
+        return _parse_devices(result.stdout, emulators_only)
     except (FileNotFoundError, subprocess.CalledProcessError) as e:
         logging.error(f"Error getting running devices: {e}")
         return []
 
-def stop_emulator(sdk_path, emulator_name):
-    """Stops a running Android emulator."""
+def _parse_devices(output, emulators_only=True):
+    devices = output.strip().split('\n')[1:]
+    return [line.split('\t')[0] for line in devices
+            if '\t' in line and (not emulators_only or 'emulator' in line)]
+
+async def get_running_devices_async(sdk_path, emulators_only=True):
+    """Non-blocking variant of get_running_devices for the asyncio engine."""
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(None, get_adb_client().device_ids, emulators_only)
+    except AdbError as e:
+        logging.debug(f"adb server query failed, falling back to adb: {e}")
+    adb_path = get_adb_path(sdk_path)
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            adb_path, 'devices', stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+        )
+        stdout, stderr = await proc.communicate()
+    except FileNotFoundError as e:
+        logging.error(f"Error getting running devices: {e}")
+        return []
+    if proc.returncode != 0:
+        logging.error(f"Error getting running devices: {stderr.decode(errors='replace')}")
+        return []
+    return _parse_devices(stdout.decode(errors='replace'), emulators_only)
+
+def find_emulator_serial(emulator_name):
+    """Returns the serial of the running emulator booted from the given AVD, or None."""
+    try:
+        serials = get_adb_client().device_ids()
+    except AdbError as e:
+        logging.debug(f"Could not list devices to find {emulator_name}: {e}")
+        return None
+    for serial in serials:
+        # One device with no console, or a busy one, must not end the search
+        try:
+            if emulator_console(serial, 'avd name').strip() == emulator_name:
+                return serial
+        except AdbError as e:
+            logging.debug(f"Could not read the AVD name of {serial}: {e}")
+    return None
+
+def stop_emulator(sdk_path, emulator_name, device_id=None):
+    """Stops a running Android emulator.
+
+    device_id is the emulator's serial when the caller knows it; otherwise
+    the emulator running emulator_name is looked up through the adb server.
+    Returns False without stopping anything if neither identifies one.
+    """
     logging.info(f"Stopping emulator: {emulator_name}...")
     try:
-        device_to_stop = next(iter(get_running_devices(sdk_path)), None)
-        if device_to_stop:
+        device_to_stop = device_id or find_emulator_serial(emulator_name)
+        if not device_to_stop:
+            # Never fall back to some other running emulator; it may belong to another worker
+            logging.warning(f"No running emulator found for {emulator_name}, nothing stopped.")
+            return False
+        try:
+            emulator_console(device_to_stop, 'kill')
+        except AdbError as e:
+            logging.debug(f"Console kill failed, falling back to adb: {e}")
             adb_path = get_adb_path(sdk_path)
             subprocess.run([adb_path, '-s', device_to_stop, 'emu', 'kill'], check=True)
-            logging.info(f"Emulator {emulator_name} ({device_to_stop}) stopped.")
-            return True
-        else:
-            logging.warning("No running emulator found to stop.")
-            return False
+        logging.info(f"Emulator {emulator_name} ({device_to_stop}) stopped.")
+        return True
     except Exception as e:
         logging.error(f"Error stopping emulator: {e}")
         return False
 
+class DeviceStateManager:
+    """Resets emulators to a clean baseline snapshot between accounts.
+
+    The baseline is saved with `avd snapshot save` through the emulator
+    console the first time a device is prepared, and loaded again after
+    every task. Loading takes seconds where a cold boot takes minutes.
+    Devices that are not emulators (e.g. BlueStacks) are left alone.
+    """
+
+    def __init__(self, snapshot='clean_baseline', timeout=120, snapshot_timeout=300):
+        self.snapshot = snapshot
+        self.timeout = timeout
+        # Saving or loading writes the whole RAM image, far slower than other console commands
+        self.snapshot_timeout = snapshot_timeout
+        self.reset_seconds = defaultdict(list)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def supports(device_id):
+        return device_id.startswith('emulator-')
+
+    def has_baseline(self, device_id):
+        try:
+            return self.snapshot in emulator_console(device_id, 'avd snapshot list').split()
+        except AdbError:
+            return False
+
+    def save_baseline(self, device_id):
+        logging.info(f"Saving snapshot {self.snapshot} on {device_id}...")
+        emulator_console(device_id, f'avd snapshot save {self.snapshot}', self.snapshot_timeout)
+
+    def prepare(self, device_ids):
+        """Makes sure every emulator has a baseline, saving the current state where it is missing.
+
+        Returns the device ids that can be reset.
+        """
+        ready = []
+        for device_id in device_ids:
+            if not self.supports(device_id):
+                logging.warning(f"{device_id} is not an emulator, it will not be reset between accounts")
+                continue
+            try:
+                if not self.has_baseline(device_id):
+                    self.save_baseline(device_id)
+                ready.append(device_id)
+            except AdbError as e:
+                logging.error(f"Could not save a baseline on {device_id}: {e}")
+        return ready
+
+    def reset(self, device_id):
+        """Loads the baseline and waits until the device is ready again. Returns True if it is."""
+        if not self.supports(device_id):
+            return True
+        started = time.monotonic()
+        try:
+            emulator_console(device_id, f'avd snapshot load {self.snapshot}', self.snapshot_timeout)
+        except AdbError as e:
+            logging.error(f"Snapshot load failed on {device_id}: {e}")
+            return False
+        ready = wait_for_boot(device_id, self.timeout)
+        elapsed = time.monotonic() - started
+        with self._lock:
+            self.reset_seconds[device_id].append(elapsed)
+        if ready:
+            logging.info(f"{device_id} reset in {elapsed:.1f}s")
+        else:
+            logging.error(f"{device_id} not ready {elapsed:.0f}s after loading {self.snapshot}")
+        return ready
+
+    def stats(self):
+        """Returns reset count, mean and max seconds per device."""
+        with self._lock:
+            return {
+                device_id: {'resets': len(times), 'mean_seconds': sum(times) / len(times), 'max_seconds': max(times)}
+                for device_id, times in self.reset_seconds.items() if times
+            }
+
+    def log_stats(self):
+        for device_id, stats in self.stats().items():
+            logging.info(
+                f"  {device_id}: {stats['resets']} resets, "
+                f"{stats['mean_seconds']:.1f}s mean, {stats['max_seconds']:.1f}s max"
+            )
+
 def start_bluestacks(exe_path, instance_name):
     """Starts a specific BlueStacks instance from its executable path."""
     logging.info(f"Attempting to start BlueStacks instance '{instance_name}'...")
@@ -87,12 +285,16 @@ def connect_to_bluestacks(sdk_path, port):
     device_id = f"localhost:{port}"
     logging.info(f"Attempting to connect to BlueStacks at {device_id}...")
     try:
-        result = subprocess.run([adb_path, 'connect', device_id], capture_output=True, text=True, check=True)
-        if "connected" in result.stdout:
+        try:
+            response = get_adb_client().connect(device_id)
+        except AdbError as e:
+            logging.debug(f"adb server connect failed, falling back to adb: {e}")
+            response = subprocess.run([adb_path, 'connect', device_id], capture_output=True, text=True, check=True).stdout
+        if "connected" in response:
             logging.info(f"Successfully connected to BlueStacks: {device_id}")
             return device_id
         else:
-            logging.error(f"Failed to connect to BlueStacks. Response: {result.stdout}")
+            logging.error(f"Failed to connect to BlueStacks. Response: {response}")
             return None
     except (FileNotFoundError, subprocess.CalledProcessError) as e:
         logging.error(f"Error connecting to BlueStacks: {e}")
@@ -104,7 +306,11 @@ def disconnect_from_bluestacks(sdk_path, port):
     device_id = f"localhost:{port}"
     logging.info(f"Disconnecting from BlueStacks at {device_id}...")
     try:
-        subprocess.run([adb_path, 'disconnect', device_id], check=True)
+        try:
+            get_adb_client().disconnect(device_id)
+        except AdbError as e:
+            logging.debug(f"adb server disconnect failed, falling back to adb: {e}")
+            subprocess.run([adb_path, 'disconnect', device_id], check=True)
         logging.info(f"Successfully disconnected from {device_id}")
         return True
     except (FileNotFoundError, subprocess.CalledProcessError) as e:
@@ -112,18 +318,18 @@ def disconnect_from_bluestacks(sdk_path, port):
         return False
 
 if __name__ == '__main__':
-    from logger_setup import setup_logger
+    # Run as `python -m src.emulator_manager` from the project root
+    from src.logger_setup import setup_logger
     setup_logger()
-    import time
     sdk_path = os.environ.get("ANDROID_HOME") or os.environ.get("ANDROID_SDK_ROOT")
     if sdk_path:
         emulators = list_emulators(sdk_path)
         if emulators:
             emulator_to_test = emulators[0]
-            start_emulator(sdk_path, emulator_to_test)
-            logging.info("\nWaiting for 30 seconds for emulator to boot...")
-            time.sleep(30)
-            stop_emulator(sdk_path, emulator_to_test)
+            process = start_emulator(sdk_path, emulator_to_test, port=5554)
+            logging.info("Waiting for the emulator to boot...")
+            if process and wait_for_boot('emulator-5554', process=process):
+                stop_emulator(sdk_path, emulator_to_test, 'emulator-5554')
     else:
         logging.error("ANDROID_HOME or ANDROID_SDK_ROOT environment variable not set.")
         logging.error("Please set it to your Android SDK root directory.")
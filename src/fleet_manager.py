@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+
+"""Boots a fleet of AVDs in parallel and generates the parallel_workers list for them."""
+
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from src.adb_client import get_adb_client
+from src.appium_manager import AppiumManager, allocate_ports, appium_ready, get_appium_settings
+from src.emulator_manager import ensure_adb_server, is_boot_completed, start_emulator, wait_for_boot
+from src.waits import wait_until
+
+# Defaults, overridable through the "fleet" section of config.json
+FLEET_DEFAULTS = {
+    'avds': [],
+    'base_console_port': 5554,
+    'base_appium_port': 4723,
+    'boot_timeout_seconds': 300,
+    'appium_timeout_seconds': 60,
+    'emulator_args': [],
+    'start_appium': True,
+}
+
+def get_fleet_settings(config):
+    return dict(FLEET_DEFAULTS, **config.get('fleet', {}))
+
+def plan_fleet(settings, appium_settings):
+    """Assigns each AVD its console port, adb serial, Appium port and UiAutomator2 host ports."""
+    return [
+        dict(
+            allocate_ports(i, appium_settings, settings['base_appium_port'] + i),
+            avd=avd,
+            console_port=settings['base_console_port'] + 2 * i,
+            device_id=f"emulator-{settings['base_console_port'] + 2 * i}",
+        )
+        for i, avd in enumerate(settings['avds'])
+    ]
+
+def bring_up(sdk_path, device, settings, appium=None):
+    """Boots one AVD (unless it is already up) and makes sure its Appium server answers.
+
+    With an AppiumManager the server is started before the boot, so the two
+    come up together. Returns the device dict with 'boot_seconds' and
+    'ready' filled in.
+    """
+    started = time.monotonic()
+    device_id = device['device_id']
+    port = device['appium_port']
+    server = appium.launch(port) if appium else None
+    process = None
+    if get_adb_client().get_state(device_id) == 'device' and is_boot_completed(device_id):
+        logging.info(f"{device_id} is already running")
+    else:
+        process = start_emulator(sdk_path, device['avd'], device['console_port'], settings['emulator_args'])
+        if not process:
+            return dict(device, ready=False, boot_seconds=None)
+    booted = wait_for_boot(device_id, settings['boot_timeout_seconds'], process)
+    device = dict(device, boot_seconds=round(time.monotonic() - started, 1))
+    if not booted:
+        return dict(device, ready=False)
+
+    if server:
+        ready = server.wait_ready(settings['appium_timeout_seconds'])
+    else:
+        ready = bool(wait_until(lambda: appium_ready(port), timeout=settings['appium_timeout_seconds'],
+                                description=f'Appium on port {port}'))
+    logging.info(f"{device['avd']} is {device_id} on Appium port {port}, up in {device['boot_seconds']}s")
+    return dict(device, ready=ready)
+
+def boot_fleet(config, appium=None):
+    """Brings up every AVD in the "fleet" section at once.
+
+    Appium servers are started through the given AppiumManager; without one
+    they are expected to be running already. Returns the parallel_workers
+    list for the devices that came up with a working Appium server.
+    """
+    settings = get_fleet_settings(config)
+    sdk_path = config.get('android_sdk_path', '')
+    fleet = plan_fleet(settings, get_appium_settings(config))
+    if not fleet:
+        logging.warning("No AVDs listed in the fleet section")
+        return []
+
+    started = time.monotonic()
+    ensure_adb_server(sdk_path)
+    with ThreadPoolExecutor(max_workers=len(fleet)) as executor:
+        devices = list(executor.map(lambda device: bring_up(sdk_path, device, settings, appium), fleet))
+
+    workers = [
+        {key: d[key] for key in ('device_id', 'appium_port', 'system_port', 'chromedriver_port')}
+        for d in devices if d['ready']
+    ]
+    for device in devices:
+        if not device['ready']:
+            logging.error(f"{device['avd']} ({device['device_id']}) did not come up")
+    logging.info(f"Fleet: {len(workers)}/{len(fleet)} devices ready in {time.monotonic() - started:.1f}s")
+    logging.info(f"parallel_workers: {json.dumps(workers)}")
+    return workers
+
+if __name__ == '__main__':
+    # Run as `python -m src.fleet_manager` from the project root
+    from src.config_reader import read_config
+    from src.logger_setup import setup_logger
+    setup_logger()
+    config = read_config()
+    # Servers started here keep running after this script exits
+    appium = AppiumManager(get_appium_settings(config)) if get_fleet_settings(config)['start_appium'] else None
+    print(json.dumps(boot_fleet(config, appium), indent=4))
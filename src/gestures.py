@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+
+"""Batched input: multi-step gestures and text entry sent as one W3C Actions request.
+
+Each ActionBatch collects pointer and key actions and sends them in a
+single POST /actions. The commands the same input would have taken one at
+a time are recorded in the task profile as commands saved.
+"""
+
+from selenium.webdriver.common.keys import Keys
+from selenium.webdriver.remote.command import Command
+
+from src.profiler import record_saved_commands
+
+class ActionBatch:
+    """Builds one W3C Actions payload with a touch pointer and a keyboard, tick by tick."""
+
+    def __init__(self, driver):
+        self.driver = driver
+        self._pointer = []
+        self._keys = []
+        # Commands the same input takes when sent one call at a time
+        self.unbatched_commands = 0
+
+    def _tick(self, pointer=None, key=None):
+        # Both sources advance together, so each tick pauses the idle one
+        self._pointer.append(pointer or {'type': 'pause', 'duration': 0})
+        self._keys.append(key or {'type': 'pause', 'duration': 0})
+
+    def pause(self, ms):
+        self._tick(pointer={'type': 'pause', 'duration': int(ms)})
+        return self
+
+    def _press_at(self, move):
+        self._tick(pointer=move)
+        self._tick(pointer={'type': 'pointerDown', 'button': 0})
+        self._tick(pointer={'type': 'pointerUp', 'button': 0})
+
+    def tap(self, x, y):
+        self._press_at({'type': 'pointerMove', 'duration': 0, 'x': int(x), 'y': int(y)})
+        self.unbatched_commands += 1
+        return self
+
+    def tap_element(self, element):
+        self._press_at({'type': 'pointerMove', 'duration': 0, 'origin': element, 'x': 0, 'y': 0})
+        self.unbatched_commands += 1
+        return self
+
+    def swipe(self, start, end, duration_ms=400):
+        self._tick(pointer={'type': 'pointerMove', 'duration': 0, 'x': int(start[0]), 'y': int(start[1])})
+        self._tick(pointer={'type': 'pointerDown', 'button': 0})
+        self._tick(pointer={'type': 'pointerMove', 'duration': int(duration_ms), 'x': int(end[0]), 'y': int(end[1])})
+        self._tick(pointer={'type': 'pointerUp', 'button': 0})
+        self.unbatched_commands += 1
+        return self
+
+    def keys(self, text):
+        for char in text:
+            self._tick(key={'type': 'keyDown', 'value': char})
+            self._tick(key={'type': 'keyUp', 'value': char})
+        return self
+
+    def clear_focused(self):
+        """Selects everything in the focused field and deletes it."""
+        self._tick(key={'type': 'keyDown', 'value': Keys.CONTROL})
+        self.keys('a')
+        self._tick(key={'type': 'keyUp', 'value': Keys.CONTROL})
+        self.keys(Keys.BACKSPACE)
+        return self
+
+    def replace_text(self, element, text):
+        """Focuses the element, clears it and types text: what clear() and send_keys() do in two calls."""
+        self.tap_element(element).clear_focused().keys(text)
+        self.unbatched_commands += 1
+        return self
+
+    def perform(self):
+        if not self._pointer:
+            return
+        self.driver.execute(Command.W3C_ACTIONS, {'actions': [
+            {'type': 'pointer', 'id': 'finger', 'parameters': {'pointerType': 'touch'}, 'actions': self._pointer},
+            {'type': 'key', 'id': 'keyboard', 'actions': self._keys},
+        ]})
+        record_saved_commands(self.unbatched_commands - 1)
+        self._pointer, self._keys = [], []
+        self.unbatched_commands = 0
+
+def swipes(driver, strokes, duration_ms=400, interval_ms=100):
+    """Performs several (start, end) swipes in one request."""
+    batch = ActionBatch(driver)
+    for i, (start, end) in enumerate(strokes):
+        if i:
+            batch.pause(interval_ms)
+        batch.swipe(start, end, duration_ms)
+    batch.perform()
+
+def taps(driver, points, interval_ms=100):
+    """Taps each (x, y) point in order in one request."""
+    batch = ActionBatch(driver)
+    for i, (x, y) in enumerate(points):
+        if i:
+            batch.pause(interval_ms)
+        batch.tap(x, y)
+    batch.perform()
+
+def type_into(driver, element, text):
+    """Replaces the text of an input field in one request."""
+    ActionBatch(driver).replace_text(element, text).perform()
+
+def fling_to_end(driver, area, direction='down', max_flings=10):
+    """Flings the area (left, top, width, height) until UiAutomator2 reports nothing more to scroll.
+
+    Returns the number of flings made.
+    """
+    left, top, width, height = area
+    for fling in range(1, max_flings + 1):
+        more = driver.execute_script('mobile: flingGesture', {
+            'left': left, 'top': top, 'width': width, 'height': height,
+            'direction': direction, 'speed': 7500,
+        })
+        if not more:
+            return fling
+    return max_flings
@@ -1,13 +1,127 @@
+import atexit
+import contextvars
+import copy
+import json
 import logging
+import queue
 import sys
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 
-def setup_logger():
-    """Sets up the root logger to output to console and a file."""
-    logging.basicConfig(
-        level=logging.INFO,
-        format="%(asctime)s [%(levelname)s] %(message)s",
-        handlers=[
-            logging.FileHandler("automation.log"),
-            logging.StreamHandler(sys.stdout)
-        ]
-    )
+LOG_FORMAT = "%(asctime)s [%(levelname)s] %(message)s"
+
+# Structured fields attached to every record logged while a task is running
+CONTEXT_FIELDS = ('row_index', 'email', 'device_id', 'phase')
+
+_task_context = contextvars.ContextVar('task_context', default=None)
+
+def start_task_context(**fields):
+    """Attaches the given fields to every record logged by this task. Returns a token for end_task_context."""
+    return _task_context.set(dict(fields, started=time.monotonic()))
+
+def set_phase(phase):
+    """Records which phase of the task is running."""
+    context = _task_context.get()
+    if context is not None:
+        _task_context.set(dict(context, phase=phase))
+
+def current_phase():
+    context = _task_context.get()
+    return context.get('phase') if context else None
+
+def end_task_context(token):
+    _task_context.reset(token)
+
+class TaskContextFilter(logging.Filter):
+    """Copies the current task context, and the ms elapsed since the task started, onto the record."""
+
+    def filter(self, record):
+        context = _task_context.get() or {}
+        for field in CONTEXT_FIELDS:
+            setattr(record, field, context.get(field))
+        started = context.get('started')
+        record.elapsed_ms = int((time.monotonic() - started) * 1000) if started else None
+        return True
+
+class JsonLinesFormatter(logging.Formatter):
+    """Formats each record as one JSON object per line."""
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'thread': record.threadName,
+            'message': record.getMessage(),
+        }
+        for field in CONTEXT_FIELDS + ('elapsed_ms',):
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            # Already formatted by TracebackQueueHandler
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+_traceback_formatter = logging.Formatter()
+
+class TracebackQueueHandler(QueueHandler):
+    """A QueueHandler that passes the traceback on as exc_text.
+
+    The stdlib prepare() folds the traceback into the message and clears
+    exc_info, so formatters behind the queue could not tell it apart.
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = _traceback_formatter.formatException(record.exc_info)
+        # The queue may outlive the arguments, and tracebacks keep whole frames alive
+        record.msg = record.getMessage()
+        record.args = None
+        record.exc_info = None
+        return record
+
+def _file_handler(path, settings):
+    if settings.get('max_bytes'):
+        return RotatingFileHandler(path, maxBytes=settings['max_bytes'], backupCount=settings.get('backup_count', 5))
+    return logging.FileHandler(path)
+
+def setup_logger(settings=None):
+    """Sets up the root logger to output to console and a file.
+
+    settings is the optional "logging" section of config.json. By default
+    records are handed to a QueueListener thread, so worker threads never
+    wait on handler locks or disk and console I/O. Safe to call more than
+    once, and leaves handlers added by others (such as the GUI log viewer)
+    in place.
+    """
+    settings = settings or {}
+    root = logging.getLogger()
+    root.setLevel(settings.get('level', 'INFO'))
+    if any(getattr(h, 'automation_handler', False) for h in root.handlers):
+        return
+
+    formatter = logging.Formatter(LOG_FORMAT)
+    handlers = [_file_handler(settings.get('file', 'automation.log'), settings), logging.StreamHandler(sys.stdout)]
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    if settings.get('json_file'):
+        json_handler = _file_handler(settings['json_file'], settings)
+        json_handler.setFormatter(JsonLinesFormatter())
+        handlers.append(json_handler)
+
+    if settings.get('queue', True):
+        listener = QueueListener(queue.Queue(-1), *handlers, respect_handler_level=True)
+        queue_handler = TracebackQueueHandler(listener.queue)
+        queue_handler.addFilter(TaskContextFilter())
+        queue_handler.automation_handler = True
+        root.addHandler(queue_handler)
+        listener.start()
+        atexit.register(listener.stop)
+    else:
+        for handler in handlers:
+            handler.addFilter(TaskContextFilter())
+            handler.automation_handler = True
+            root.addHandler(handler)
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+
+"""Page source fetched once per step and probed locally until the page can have changed."""
+
+import logging
+import threading
+from lxml import etree, html as lxml_html
+
+# Commands that cannot change what the page looks like; anything else
+# invalidates the cached snapshot.
+READ_ONLY_COMMANDS = {
+    'getPageSource', 'findElement', 'findElements', 'findChildElement', 'findChildElements',
+    'getCurrentUrl', 'getTitle', 'getElementAttribute', 'getElementProperty', 'getElementText',
+    'getElementTagName', 'getElementRect', 'isElementEnabled', 'isElementSelected',
+    'getWindowRect', 'screenshot', 'elementScreenshot', 'getCurrentContext', 'getContexts',
+    'getCurrentActivity', 'getCurrentPackage', 'queryAppState', 'isAppInstalled', 'getStatus',
+}
+
+class PageSnapshot:
+    """Caches driver.page_source and evaluates text and XPath probes against it."""
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.fetches = 0
+        self._lock = threading.Lock()
+        self.invalidate()
+
+    def invalidate(self):
+        self._source = None
+        self._lower = None
+        self._tree = None
+
+    @property
+    def source(self):
+        with self._lock:
+            if self._source is None:
+                self._source = self.driver.page_source
+                self.fetches += 1
+            return self._source
+
+    def text(self):
+        """Returns the lowercased page source."""
+        if self._lower is None:
+            self._lower = self.source.lower()
+        return self._lower
+
+    def contains_any(self, *needles):
+        text = self.text()
+        return any(needle.lower() in text for needle in needles)
+
+    def tree(self):
+        if self._tree is None:
+            source = self.source
+            # Native contexts return a UiAutomator XML hierarchy, web contexts return HTML
+            if source.lstrip().startswith('<?xml') or '<hierarchy' in source[:200]:
+                self._tree = etree.fromstring(source.encode('utf-8'))
+            else:
+                self._tree = lxml_html.fromstring(source)
+        return self._tree
+
+    def xpath(self, expression):
+        """Returns the nodes matching the expression, or [] if it cannot be evaluated locally."""
+        try:
+            return self.tree().xpath(expression)
+        except (etree.XPathError, etree.ParserError, ValueError) as e:
+            logging.debug(f"Local xpath failed for {expression}: {e}")
+            return []
+
+    def first_match(self, expressions):
+        """Returns the first expression with at least one match, or None."""
+        for expression in expressions:
+            if self.xpath(expression):
+                return expression
+        return None
+
+def page_snapshot(driver):
+    """Returns the snapshot attached to the driver, attaching one on first use.
+
+    The driver's execute method is wrapped so that any command that may
+    change the page drops the cached source.
+    """
+    snapshot = getattr(driver, '_page_snapshot', None)
+    if snapshot is None:
+        snapshot = PageSnapshot(driver)
+        execute = driver.execute
+
+        def tracked_execute(driver_command, params=None):
+            if driver_command not in READ_ONLY_COMMANDS:
+                snapshot.invalidate()
+            return execute(driver_command, params)
+
+        driver.execute = tracked_execute
+        driver._page_snapshot = snapshot
+    return snapshot
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+
+"""Per-phase completion state, failure classification and the retry policy."""
+
+from selenium.common.exceptions import (
+    InvalidSessionIdException, NoSuchElementException, StaleElementReferenceException, TimeoutException,
+)
+
+from src.accounts_reader import row_key
+from src.action_plan import StepFailed
+from src.adb_client import AdbError
+
+# Done once per account, whichever device did it; the rest is device state
+ACCOUNT_PHASES = ('join_group', 'accept_beta')
+
+SESSION_LOST = 'session_lost'
+ELEMENT_TIMEOUT = 'element_timeout'
+DEVICE_OFFLINE = 'device_offline'
+HARD = 'hard'
+
+DEVICE_OFFLINE_MARKERS = (
+    'device offline', 'device not found', 'no devices/emulators', 'could not find a connected android device',
+    'device unauthorized',
+)
+SESSION_LOST_MARKERS = (
+    'invalid session id', 'session is either terminated', 'no such session', 'socket hang up',
+    'connection refused', 'connection reset', 'max retries exceeded', 'driver init failed',
+    'instrumentation process is not running', 'uiautomator2 server',
+)
+
+# Defaults, overridable through the "retry" section of config.json
+RETRY_DEFAULTS = {
+    'max_attempts': 3,
+    'backoff_seconds': 5,
+    'backoff_factor': 2,
+    'max_backoff_seconds': 60,
+    'retry_on': [SESSION_LOST, ELEMENT_TIMEOUT, DEVICE_OFFLINE],
+    'move_on': [DEVICE_OFFLINE],
+}
+
+def classify_error(error):
+    """Sorts an exception into session_lost, element_timeout, device_offline or hard."""
+    message = str(error).lower()
+    if isinstance(error, AdbError) or any(marker in message for marker in DEVICE_OFFLINE_MARKERS):
+        return DEVICE_OFFLINE
+    if (isinstance(error, (InvalidSessionIdException, ConnectionError))
+            or any(marker in message for marker in SESSION_LOST_MARKERS)):
+        return SESSION_LOST
+    if isinstance(error, (TimeoutException, NoSuchElementException, StaleElementReferenceException, StepFailed)):
+        return ELEMENT_TIMEOUT
+    return HARD
+
+class RetryPolicy:
+    """Which failure classes are retried, how often, after what delay, and which move to another device."""
+
+    def __init__(self, settings=None):
+        settings = dict(RETRY_DEFAULTS, **(settings or {}))
+        self.max_attempts = settings['max_attempts']
+        self.backoff_seconds = settings['backoff_seconds']
+        self.backoff_factor = settings['backoff_factor']
+        self.max_backoff_seconds = settings['max_backoff_seconds']
+        self.retry_on = set(settings['retry_on'])
+        self.move_on = set(settings['move_on'])
+
+    def should_retry(self, error_class, attempt):
+        return error_class in self.retry_on and attempt < self.max_attempts
+
+    def should_move(self, error_class):
+        return error_class in self.move_on
+
+    def delay(self, attempt):
+        """Backoff before the attempt after the given one."""
+        return min(self.backoff_seconds * self.backoff_factor ** (attempt - 1), self.max_backoff_seconds)
+
+def carry_over(resume, device_id, device_reset=False):
+    """Returns the phases a new attempt can skip, from the state an earlier attempt left in resume.
+
+    Account-level phases always carry over. Device-level phases only do on
+    the same device, and not at all once the device has been reset.
+    """
+    phases = (resume or {}).get('phases') or {}
+    same_device = resume and resume.get('device_id') == device_id and not device_reset
+    return {
+        name: state for name, state in phases.items()
+        if state == 'done' and (name in ACCOUNT_PHASES or same_device)
+    }
+
+def with_resume_state(rows, previous):
+    """Attaches the phase state of failed rows in an earlier checkpoint, so --resume skips finished phases."""
+    for row_index, account in rows:
+        record = previous.get(row_key(row_index, account.get('email', '')))
+        if record and record.get('phases'):
+            account = dict(account, _resume={'phases': record['phases'], 'device_id': record.get('device_id')})
+        yield row_index, account
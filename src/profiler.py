@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+
+"""Per-task timing of phases, waits and Appium commands."""
+
+import contextvars
+import functools
+import time
+from contextlib import contextmanager
+
+from src.logger_setup import current_phase, set_phase
+
+_current_profile = contextvars.ContextVar('task_profile', default=None)
+
+class TaskProfile:
+    """Collects phase durations, time spent waiting and Appium command counts for one task."""
+
+    def __init__(self, device_id):
+        self.device_id = device_id
+        self.started = time.time()
+        self.ended = None
+        self.phases = []
+        self.wait_seconds = 0.0
+        self.commands = 0
+        self.commands_saved = 0
+
+    def add_phase(self, name, started, seconds):
+        self.phases.append({'name': name, 'start': round(started - self.started, 3), 'seconds': round(seconds, 3)})
+
+    def to_dict(self):
+        ended = self.ended or time.time()
+        total = ended - self.started
+        return {
+            'device_id': self.device_id,
+            'start': self.started,
+            'end': ended,
+            'phases': list(self.phases),
+            'wait_seconds': round(self.wait_seconds, 3),
+            'active_seconds': round(max(total - self.wait_seconds, 0.0), 3),
+            'commands': self.commands,
+            'commands_saved': self.commands_saved,
+        }
+
+def start_profile(device_id):
+    """Starts profiling the current task. Returns (profile, token)."""
+    profile = TaskProfile(device_id)
+    return profile, _current_profile.set(profile)
+
+def end_profile(profile, token):
+    profile.ended = time.time()
+    _current_profile.reset(token)
+    return profile.to_dict()
+
+def current_profile():
+    return _current_profile.get()
+
+@contextmanager
+def timed_phase(name):
+    """Times the enclosed block as a phase of the current task and marks it in the log context."""
+    profile = _current_profile.get()
+    outer_phase = current_phase()
+    set_phase(name)
+    started = time.time()
+    try:
+        yield
+    finally:
+        set_phase(outer_phase)
+        if profile is not None:
+            profile.add_phase(name, started, time.time() - started)
+
+def profiled(func):
+    """Decorator that times every call of func as a phase named after it."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with timed_phase(func.__name__):
+            return func(*args, **kwargs)
+    return wrapper
+
+def add_deferred_phase(profile, name, started, seconds):
+    """Adds a phase that ran after the task returned, such as a deferred dwell, to a finished profile dict."""
+    if not profile:
+        return
+    profile['phases'].append({'name': name, 'start': round(started - profile['start'], 3), 'seconds': round(seconds, 3)})
+    profile['end'] = max(profile['end'], started + seconds)
+    profile['wait_seconds'] = round(profile['wait_seconds'] + seconds, 3)
+    profile['active_seconds'] = round(max(profile['end'] - profile['start'] - profile['wait_seconds'], 0.0), 3)
+
+def record_wait(seconds):
+    """Adds time spent blocked on a wait to the current task."""
+    profile = _current_profile.get()
+    if profile is not None:
+        profile.wait_seconds += seconds
+
+def record_saved_commands(count):
+    """Adds Appium commands avoided by batching input to the current task."""
+    profile = _current_profile.get()
+    if profile is not None and count > 0:
+        profile.commands_saved += count
+
+def count_commands(driver):
+    """Wraps the driver so every Appium command is counted against the task that sends it."""
+    execute = driver.execute
+
+    def counted_execute(driver_command, params=None):
+        profile = _current_profile.get()
+        if profile is not None:
+            profile.commands += 1
+        return execute(driver_command, params)
+
+    driver.execute = counted_execute
+    return driver
@@ -2,69 +2,279 @@
 
 """Generates a minimalist and sleek HTML report from test results."""
 
+import html
+import json
+import math
+import tempfile
+import threading
 import time
 import logging
+from collections import defaultdict
 
-def generate_html_report(results):
-    """Generates an HTML report from a list of result dictionaries."""
-    
-    # --- CSS Styles (embedded for portability) ---
-    styles = """
-    <style>
-        body { font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", Roboto, Helvetica, Arial, sans-serif; background-color: #f4f7f9; color: #333; margin: 0; padding: 2em; }
-        .container { max-width: 1000px; margin: auto; background: #fff; padding: 2em; border-radius: 8px; box-shadow: 0 4px 12px rgba(0,0,0,0.05); }
-        h1 { color: #2c3e50; }
-        p { color: #555; }
-        .summary { display: flex; justify-content: space-around; padding: 1em 0; margin-bottom: 2em; border-top: 1px solid #eee; border-bottom: 1px solid #eee; }
-        .summary-item { text-align: center; }
-        .summary-item h2 { margin: 0; font-size: 2em; }
-        .summary-item p { margin: 0; color: #7f8c8d; }
-        table { width: 100%; border-collapse: collapse; }
-        th, td { padding: 12px 15px; text-align: left; border-bottom: 1px solid #ddd; }
-        th { background-color: #ecf0f1; }
-        .status-success { color: #27ae60; font-weight: bold; }
-        .status-failure { color: #c0392b; font-weight: bold; }
-        a { color: #2980b9; text-decoration: none; }
-        a:hover { text-decoration: underline; }
-    </style>
+# --- CSS Styles (embedded for portability) ---
+# The container is a flex column so the summary, which is only known once the
+# last row is written, can be emitted at the end of the file but shown on top.
+STYLES = """
+<style>
+    body { font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", Roboto, Helvetica, Arial, sans-serif; background-color: #f4f7f9; color: #333; margin: 0; padding: 2em; }
+    .container { max-width: 1000px; margin: auto; background: #fff; padding: 2em; border-radius: 8px; box-shadow: 0 4px 12px rgba(0,0,0,0.05); display: flex; flex-direction: column; }
+    .container > h1, .container > p { order: -2; }
+    h1 { color: #2c3e50; }
+    p { color: #555; }
+    .summary { order: -1; display: flex; justify-content: space-around; padding: 1em 0; margin-bottom: 2em; border-top: 1px solid #eee; border-bottom: 1px solid #eee; }
+    .summary-item { text-align: center; }
+    .summary-item h2 { margin: 0; font-size: 2em; }
+    .summary-item p { margin: 0; color: #7f8c8d; }
+    table { width: 100%; border-collapse: collapse; }
+    th, td { padding: 12px 15px; text-align: left; border-bottom: 1px solid #ddd; }
+    th { background-color: #ecf0f1; }
+    .status-success { color: #27ae60; font-weight: bold; }
+    .status-failure { color: #c0392b; font-weight: bold; }
+    a { color: #2980b9; text-decoration: none; }
+    a:hover { text-decoration: underline; }
+    h2.section { color: #2c3e50; margin-top: 1.5em; }
+    .timeline-row { display: flex; align-items: center; margin: 4px 0; }
+    .timeline-label { width: 140px; font-size: 0.85em; color: #555; flex-shrink: 0; }
+    .timeline-track { position: relative; flex-grow: 1; height: 18px; background: #f4f7f9; }
+    .timeline-task { position: absolute; top: 0; height: 18px; background: #bdc3c7; overflow: hidden; }
+    .timeline-phase { position: absolute; top: 3px; height: 12px; }
+    .legend span { display: inline-block; margin-right: 1em; font-size: 0.85em; }
+    .legend i { display: inline-block; width: 10px; height: 10px; margin-right: 4px; }
+</style>
+"""
+
+class ReportWriter:
+    """Writes the report incrementally: header first, a row per result as it arrives, summary last.
+
+    Each row is flushed as soon as it is added, so a long run has a live,
+    partially written report. Memory does not grow with the row count: only
+    the pass/fail counts and the RunProfile aggregates are kept. add() may be
+    called from several threads at once.
+    """
+
+    def __init__(self, path="report.html"):
+        self.path = path
+        self.total = 0
+        self.passed = 0
+        self.profile = RunProfile()
+        self._file = None
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def open(self):
+        self._file = open(self.path, "w", buffering=64 * 1024)
+        generation_time = time.strftime("%Y-%m-%d %H:%M:%S")
+        self._file.write(
+            f"<html><head><title>Automation Test Report</title>{STYLES}</head><body><div class=\"container\">"
+            "<h1>Automation Test Report</h1>"
+            f"<p>Generated on: {generation_time}</p>"
+            "<table><tr><th>#</th><th>Account</th><th>Status</th><th>Details</th><th>Screenshot</th></tr>"
+        )
+        self._file.flush()
+
+    def add(self, result):
+        with self._lock:
+            self._add(result)
+
+    def _add(self, result):
+        if not self._file:
+            return
+        success = result['status'] == 'Success'
+        if result.get('profile'):
+            self.profile.add(result['email'], result['profile'])
+        status_class = 'status-success' if success else 'status-failure'
+        screenshot_link = f'<a href="{html.escape(result["screenshot_path"])}" target="_blank">View</a>' if result.get("screenshot_path") else "N/A"
+        artifacts = result.get('artifacts') or {}
+        for label, key in (('source', 'page_source'), ('logcat', 'logcat')):
+            if artifacts.get(key):
+                screenshot_link += f' <a href="{html.escape(artifacts[key])}" target="_blank">{label}</a>'
+        self.total += 1
+        if success:
+            self.passed += 1
+        row_number = result.get('row_index', self.total - 1) + 1
+        self._file.write(
+            "<tr>"
+            f"<td>{row_number}</td>"
+            f"<td>{html.escape(result['email'])}</td>"
+            f"<td><span class=\"{status_class}\">{result['status'].upper()}</span></td>"
+            f"<td>{html.escape(str(result['details']))}</td>"
+            f"<td>{screenshot_link}</td>"
+            "</tr>"
+        )
+        self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+    def _close(self):
+        if not self._file:
+            return
+        failed = self.total - self.passed
+        self._file.write(
+            "</table>"
+            "<div class=\"summary\">"
+            f"<div class=\"summary-item\"><h2>{self.total}</h2><p>Total Accounts</p></div>"
+            f"<div class=\"summary-item\"><h2 style=\"color: #27ae60;\">{self.passed}</h2><p>Passed</p></div>"
+            f"<div class=\"summary-item\"><h2 style=\"color: #c0392b;\">{failed}</h2><p>Failed</p></div>"
+            "</div>"
+        )
+        if self.profile.count:
+            self.profile.write(self._file)
+        self.profile.close()
+        self._file.write("</div></body></html>")
+        self._file.close()
+        self._file = None
+
+PHASE_COLORS = ['#2980b9', '#27ae60', '#8e44ad', '#d35400', '#16a085', '#c0392b', '#f39c12', '#2c3e50']
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    return ordered[max(math.ceil(pct / 100 * len(ordered)) - 1, 0)]
+
+# Duration histogram buckets grow by 2%, so reported percentiles are within 2% of exact
+BUCKET_GROWTH = 1.02
+BUCKET_FLOOR = 0.001
+
+def _bucket(seconds):
+    return max(math.ceil(math.log(max(seconds, BUCKET_FLOOR) / BUCKET_FLOOR, BUCKET_GROWTH)), 0)
+
+def _bucket_seconds(bucket):
+    return BUCKET_FLOOR * BUCKET_GROWTH ** bucket
+
+class PhaseStats:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.buckets = defaultdict(int)
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.buckets[_bucket(seconds)] += 1
+
+    def percentile(self, pct):
+        """Nearest-rank percentile, as the upper edge of the bucket it falls in."""
+        rank = max(math.ceil(pct / 100 * self.count), 1)
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return _bucket_seconds(bucket)
+        return 0.0
+
+class RunProfile:
+    """Per-phase p50/p95 and a per-device timeline, built up one task profile at a time.
+
+    Phase durations go into histograms, and timeline spans are spilled to a
+    temporary file per device, so memory stays flat however many rows run.
     """
 
-    # --- HTML Structure ---
-    html_content = f"""<html><head><title>Automation Test Report</title>{styles}</head><body><div class="container">"""
-    html_content += "<h1>Automation Test Report</h1>"
-    generation_time = time.strftime("%Y-%m-%d %H:%M:%S")
-    html_content += f"<p>Generated on: {generation_time}</p>"
-
-    # --- Summary Section ---
-    total = len(results)
-    passed = sum(1 for r in results if r['status'] == 'Success')
-    failed = total - passed
-    html_content += f"""<div class="summary">
-        <div class="summary-item"><h2>{total}</h2><p>Total Accounts</p></div>
-        <div class="summary-item"><h2 style="color: #27ae60;">{passed}</h2><p>Passed</p></div>
-        <div class="summary-item"><h2 style="color: #c0392b;">{failed}</h2><p>Failed</p></div>
-    </div>"""
-
-    # --- Results Table ---
-    html_content += "<table><tr><th>#</th><th>Account</th><th>Status</th><th>Details</th><th>Screenshot</th></tr>"
-    for i, result in enumerate(results):
-        status_class = 'status-success' if result['status'] == 'Success' else 'status-failure'
-        screenshot_link = f'<a href="{result["screenshot_path"]}" target="_blank">View</a>' if result.get("screenshot_path") else "N/A"
-        html_content += f"""<tr>
-            <td>{i+1}</td>
-            <td>{result['email']}</td>
-            <td><span class="{status_class}">{result['status'].upper()}</span></td>
-            <td>{result['details']}</td>
-            <td>{screenshot_link}</td>
-        </tr>"""
-    
-    html_content += "</table></div></body></html>"
-
-    # --- Write to file ---
+    def __init__(self):
+        self.count = 0
+        self.wait_total = self.active_total = self.commands = self.saved = 0
+        self.phases = defaultdict(PhaseStats)
+        self.run_start = None
+        self.run_end = None
+        self._spans = {}
+
+    def add(self, email, profile):
+        self.count += 1
+        for phase in profile['phases']:
+            self.phases[phase['name']].add(phase['seconds'])
+        self.wait_total += profile.get('wait_seconds', 0)
+        self.active_total += profile.get('active_seconds', 0)
+        self.commands += profile.get('commands', 0)
+        self.saved += profile.get('commands_saved', 0)
+        self.run_start = profile['start'] if self.run_start is None else min(self.run_start, profile['start'])
+        self.run_end = profile['end'] if self.run_end is None else max(self.run_end, profile['end'])
+
+        device_id = str(profile.get('device_id'))
+        spans = self._spans.get(device_id)
+        if spans is None:
+            spans = self._spans[device_id] = tempfile.TemporaryFile('w+', encoding='utf-8')
+        phases = [(phase['name'], phase['start'], phase['seconds']) for phase in profile['phases']]
+        spans.write(json.dumps([email, profile['start'], profile['end'], phases]) + '\n')
+
+    def close(self):
+        for spans in self._spans.values():
+            spans.close()
+        self._spans = {}
+
+    def write(self, out):
+        """Writes the profile section of the report to the open file."""
+        out.write("<div class=\"profile\"><h2 class=\"section\">Run Profile</h2>")
+        out.write(
+            f"<p>Waiting: {self.wait_total:.1f}s, active: {self.active_total:.1f}s, "
+            f"Appium commands: {self.commands} ({self.commands / self.count:.1f} per account), "
+            f"saved by batched input: {self.saved}</p>"
+        )
+        out.write("<table><tr><th>Phase</th><th>Count</th><th>p50 (s)</th><th>p95 (s)</th><th>Total (s)</th></tr>")
+        for name, stats in sorted(self.phases.items(), key=lambda item: -item[1].total):
+            out.write(
+                f"<tr><td>{html.escape(name)}</td><td>{stats.count}</td>"
+                f"<td>{stats.percentile(50):.2f}</td><td>{stats.percentile(95):.2f}</td>"
+                f"<td>{stats.total:.1f}</td></tr>"
+            )
+        out.write("</table>")
+
+        colors = {name: PHASE_COLORS[i % len(PHASE_COLORS)] for i, name in enumerate(sorted(self.phases))}
+        span = max(self.run_end - self.run_start, 0.001)
+        out.write("<h2 class=\"section\">Device Timeline</h2><div class=\"legend\">")
+        for name, color in colors.items():
+            out.write(f"<span><i style=\"background: {color};\"></i>{html.escape(name)}</span>")
+        out.write("</div>")
+        for device_id, spans in sorted(self._spans.items()):
+            out.write(f"<div class=\"timeline-row\"><div class=\"timeline-label\">{html.escape(device_id)}</div><div class=\"timeline-track\">")
+            spans.seek(0)
+            for line in spans:
+                email, start, end, phases = json.loads(line)
+                left = (start - self.run_start) / span * 100
+                width = max((end - start) / span * 100, 0.1)
+                task_seconds = end - start
+                out.write(
+                    f"<div class=\"timeline-task\" style=\"left: {left:.3f}%; width: {width:.3f}%;\" "
+                    f"title=\"{html.escape(email)}: {task_seconds:.1f}s\">"
+                )
+                for name, phase_start, seconds in phases:
+                    phase_left = phase_start / task_seconds * 100 if task_seconds else 0
+                    phase_width = seconds / task_seconds * 100 if task_seconds else 0
+                    out.write(
+                        f"<div class=\"timeline-phase\" style=\"left: {phase_left:.3f}%; width: {phase_width:.3f}%; "
+                        f"background: {colors[name]};\" title=\"{html.escape(name)}: {seconds:.2f}s\"></div>"
+                    )
+                out.write("</div>")
+            out.write("</div></div>")
+        out.write("</div>")
+
+def order_by_row(results):
+    """Orders results by row_index in O(n). A later result for the same row replaces an earlier one."""
+    by_index = {}
+    unindexed = []
+    for result in results:
+        row_index = result.get('row_index')
+        if row_index is None:
+            unindexed.append(result)
+        else:
+            by_index[row_index] = result
+    if not by_index:
+        return unindexed
+    return [by_index[i] for i in range(max(by_index) + 1) if i in by_index] + unindexed
+
+def generate_html_report(results, path="report.html"):
+    """Generates an HTML report from an iterable of result dictionaries."""
     try:
-        with open("report.html", "w") as f:
-            f.write(html_content)
-        logging.info("Successfully generated HTML report: report.html")
+        with ReportWriter(path) as writer:
+            for result in results:
+                writer.add(result)
+        logging.info(f"Successfully generated HTML report: {path}")
     except Exception as e:
         logging.error(f"Failed to generate HTML report: {e}")
 
@@ -0,0 +1,456 @@
+#!/usr/bin/env python
+
+"""Device-affine scheduler that leases each worker device to one task at a time."""
+
+import heapq
+import itertools
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from src import clock
+from src.automation_manager import finish_automation
+from src.profiler import add_deferred_phase
+from src.waits import WAIT_SETTINGS, ensure_foreground
+
+# Thread ceiling when max_threads is not set. Threads only start as devices
+# need them, so this is effectively one per device, including devices added
+# during the run.
+ELASTIC_THREAD_LIMIT = 256
+
+# Details of the failure reported for rows left when every device is gone
+NO_DEVICES = 'No devices available'
+
+class DwellTimer:
+    """Calls callbacks at their due time from a single background thread."""
+
+    def __init__(self):
+        self._heap = []
+        self._order = itertools.count()
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name='dwell-timer', daemon=True)
+        self._thread.start()
+
+    def call_at(self, when, callback):
+        with self._cond:
+            heapq.heappush(self._heap, (when, next(self._order), callback))
+            self._cond.notify()
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stopped:
+                    if self._heap and self._heap[0][0] <= clock.monotonic():
+                        break
+                    self._cond.wait(self._heap[0][0] - clock.monotonic() if self._heap else None)
+                if self._stopped:
+                    return
+                _, _, callback = heapq.heappop(self._heap)
+            try:
+                callback()
+            except Exception as e:
+                logging.error(f"Dwell timer callback failed: {e}")
+
+class DwellingTask:
+    """A task whose device stays leased while its app dwells, without holding a thread."""
+
+    def __init__(self, worker, session, result, started, results, on_result):
+        self.worker = worker
+        self.session = session
+        self.result = result
+        self.started = started
+        self.results = results
+        self.on_result = on_result
+        self.dwell_started = time.time()
+        self.deadline = clock.monotonic() + clock.dwell_seconds(result['dwell']['seconds'])
+
+
+class DeviceScheduler:
+    """Hands the next pending row to whichever device frees up first.
+
+    With a session_pool, results that ask for a deferred dwell keep their
+    device leased but give their thread back; a DwellTimer wakes them for
+    foreground checks and to close the app. max_threads then only has to
+    cover the devices in setup, not the ones dwelling.
+
+    on_release(worker), if given, runs after each task before the device
+    goes back to the pool, e.g. to reset it. If it returns False the device
+    is retired for the rest of the run.
+
+    A result carrying a 'retry_row' is not reported; that row is queued
+    again, preferably for a different device.
+
+    Devices can join with add_worker() and leave with drain_worker() while
+    run() is going; a drained device finishes its current task first. A
+    device that leaves, drained or retired, has its session closed, and
+    on_leave(worker), if given, runs to free anything else held for it.
+
+    If every device is gone before the rows run out, fail_fn(row, details),
+    if given, turns each remaining row into a failure result that is
+    reported like any other; without it those rows are left unreported.
+    """
+
+    def __init__(self, workers, task_fn, session_pool=None, max_threads=None, on_release=None, fail_fn=None,
+                 on_leave=None):
+        self.task_fn = task_fn
+        self.fail_fn = fail_fn
+        self.session_pool = session_pool
+        self.on_release = on_release
+        self.on_leave = on_leave
+        self.workers = []
+        seen = set()
+        for worker in workers:
+            device_id = worker.get('device_id')
+            if device_id in seen:
+                logging.warning(f"Duplicate worker for {device_id} ignored")
+                continue
+            seen.add(device_id)
+            self.workers.append(worker)
+
+        self.max_threads = max_threads
+        self._free = queue.Queue()
+        for worker in self.workers:
+            self._free.put(worker)
+        self._active = {w.get('device_id'): w for w in self.workers}
+        self._draining = set()
+
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._executor = None
+        self._timer = None
+        self._requeued = deque()
+        self._source_done = False
+        self._busy_seconds = {w.get('device_id'): 0.0 for w in self.workers}
+        self._task_counts = {w.get('device_id'): 0 for w in self.workers}
+        self._started = None
+        self._finished = None
+        self.total = None
+        self.dispatched = 0
+        self.running = 0
+        self.completed = 0
+        self.retired = 0
+
+    def run(self, rows, on_result=None, collect=True, total=None):
+        """Runs task_fn(row, worker) for every row and returns the results in completion order.
+
+        Rows are pulled from the iterable only as devices free up. With
+        collect=False results are only passed to on_result and not kept.
+        total is the row count for the pending figure when rows is a generator.
+        """
+        results = [] if collect else None
+        self.total = self._count(rows, total)
+        self._started = time.monotonic()
+
+        self._timer = DwellTimer()
+        with ThreadPoolExecutor(max_workers=self.max_threads or ELASTIC_THREAD_LIMIT) as executor:
+            self._executor = executor
+            source = iter(rows)
+            no_devices = False
+            while True:
+                worker = self._free.get()
+                if worker is None:
+                    no_devices = True
+                    break
+                if self._drain_if_idle(worker):
+                    continue
+                row = None
+                while row is None:
+                    with self._idle:
+                        # Running tasks may still hand a row back
+                        while self._source_done and not self._requeued and self.running:
+                            self._idle.wait()
+                        if self._source_done and not self._requeued:
+                            break
+                    row = self._take_row(source, worker.get('device_id'))
+                if row is None:
+                    break
+                self._dispatch()
+                executor.submit(self._run_task, row, worker, results, on_result)
+            # Dwelling tasks still need the executor to close their apps
+            with self._idle:
+                while self.running:
+                    self._idle.wait()
+        self._timer.stop()
+        if no_devices:
+            self._fail_remaining(source, results, on_result)
+
+        self._finished = time.monotonic()
+        self.log_stats()
+        return results
+
+    @staticmethod
+    def _count(rows, total):
+        if total is not None:
+            return total
+        return len(rows) if hasattr(rows, '__len__') else None
+
+    def _take_row(self, source, device_id):
+        """Returns a requeued row not meant to avoid this device, else the next new row, else None."""
+        with self._lock:
+            if self._requeued and (self._requeued[0][1] != device_id or self._source_done):
+                return self._requeued.popleft()[0]
+            if self._source_done:
+                return None
+        row = next(source, None)
+        if row is None:
+            with self._lock:
+                self._source_done = True
+        return row
+
+    def _fail_remaining(self, source, results, on_result):
+        """Reports the rows no device is left to run, including rows handed back, through fail_fn."""
+        if not self.fail_fn:
+            logging.error("No devices left, remaining rows were not run")
+            return
+        with self._lock:
+            rows = [row for row, _ in self._requeued]
+            self._requeued.clear()
+            self._source_done = True
+        failed = 0
+        for row in itertools.chain(rows, source):
+            result = self.fail_fn(row, NO_DEVICES)
+            if results is not None:
+                results.append(result)
+            if on_result:
+                on_result(result)
+            failed += 1
+        logging.error(f"No devices left, {failed} remaining rows reported as failed")
+
+    def _requeue(self, row, device_id, elapsed):
+        with self._lock:
+            self._busy_seconds[device_id] += elapsed
+            self.running -= 1
+            self.dispatched -= 1
+            self._requeued.append((row, device_id))
+            self._idle.notify_all()
+
+    def _dispatch(self):
+        with self._lock:
+            self.dispatched += 1
+            self.running += 1
+
+    def _run_task(self, row, worker, results, on_result):
+        device_id = worker.get('device_id')
+        started = time.monotonic()
+        result = None
+        try:
+            result = self.task_fn(row, worker)
+            if result and result.get('dwell') and self.session_pool:
+                self._start_dwell(DwellingTask(
+                    worker, self.session_pool.get(worker), result, started, results, on_result
+                ))
+                return
+        except Exception as e:
+            logging.error(f"Task exception on {device_id}: {e}")
+        self._complete(worker, started, result, results, on_result)
+
+    def _complete(self, worker, started, result, results, on_result):
+        retry_row = result.pop('retry_row', None) if result else None
+        if retry_row is not None:
+            self._requeue(retry_row, worker.get('device_id'), time.monotonic() - started)
+        else:
+            self._record(worker.get('device_id'), time.monotonic() - started, result, results)
+            self._report(result, on_result)
+        self._put_back(worker)
+
+    def _put_back(self, worker):
+        self._return(worker, self._release(worker))
+
+    def _return(self, worker, usable):
+        """Puts a released device back in the pool, unless it failed its release or is being drained."""
+        device_id = worker.get('device_id')
+        if not usable:
+            self._close_worker(worker)
+            last = self._leave(device_id, retired=True)
+            logging.error(f"{device_id} retired for the rest of the run")
+        elif device_id in self._draining:
+            self._close_worker(worker)
+            last = self._leave(device_id)
+            logging.info(f"{device_id} drained and removed from the pool")
+        else:
+            self._offer(worker)
+            return
+        if last:
+            # Wakes run() so it stops waiting for a device
+            self._offer(None)
+
+    def _drain_if_idle(self, worker):
+        """Drops a device taken from the pool if it was drained while idle. Returns True if dropped."""
+        if worker.get('device_id') not in self._draining:
+            return False
+        self._return(worker, True)
+        return True
+
+    def _offer(self, worker):
+        self._free.put(worker)
+
+    def _close_worker(self, worker):
+        """Closes the session of a device leaving the pool and runs the on_leave hook."""
+        if self.session_pool:
+            self.session_pool.discard(worker)
+        if self.on_leave:
+            try:
+                self.on_leave(worker)
+            except Exception as e:
+                logging.error(f"Releasing {worker.get('device_id')} after it left failed: {e}")
+
+    def _leave(self, device_id, retired=False):
+        """Takes a device out of the active set. Returns True if none are left."""
+        with self._lock:
+            self._active.pop(device_id, None)
+            self._draining.discard(device_id)
+            if retired:
+                self.retired += 1
+            return not self._active
+
+    def add_worker(self, worker):
+        """Admits a device to the running pool; it picks up the next row right away.
+
+        Re-adding a device that is still draining just cancels the drain.
+        """
+        device_id = worker.get('device_id')
+        with self._lock:
+            if device_id in self._draining:
+                self._draining.discard(device_id)
+                logging.info(f"{device_id} kept in the pool")
+                return
+            if device_id in self._active:
+                return
+            self._active[device_id] = worker
+            if device_id not in self._busy_seconds:
+                self.workers.append(worker)
+                self._busy_seconds[device_id] = 0.0
+                self._task_counts[device_id] = 0
+        logging.info(f"{device_id} added to the pool")
+        self._offer(worker)
+
+    def drain_worker(self, device_id):
+        """Stops giving rows to a device; it leaves the pool once its current task is done."""
+        with self._lock:
+            if device_id not in self._active or device_id in self._draining:
+                return
+            self._draining.add(device_id)
+        logging.info(f"Draining {device_id}")
+
+    def update_workers(self, workers, prepare=None):
+        """Makes the pool match the given worker list: drains missing devices, adds new ones.
+
+        prepare(worker), if given, runs before a new device is added; if it
+        returns False the device is left out.
+        """
+        wanted = {w.get('device_id'): w for w in workers}
+        with self._lock:
+            current = {device_id for device_id in self._active if device_id not in self._draining}
+        for device_id in current - wanted.keys():
+            self.drain_worker(device_id)
+        for device_id, worker in wanted.items():
+            if device_id in current:
+                if worker != self._active.get(device_id):
+                    logging.warning(f"Settings of {device_id} changed; remove and re-add it to apply them")
+                continue
+            if prepare and prepare(worker) is False:
+                logging.error(f"{device_id} not added, preparing it failed")
+                continue
+            self.add_worker(worker)
+
+    def _release(self, worker):
+        """Runs the on_release hook. Returns False if the device should not be used again."""
+        if not self.on_release:
+            return True
+        try:
+            return self.on_release(worker) is not False
+        except Exception as e:
+            logging.error(f"Releasing {worker.get('device_id')} failed: {e}")
+            return False
+
+    def _start_dwell(self, task):
+        dwell = task.result['dwell']
+        logging.info(f"Waiting {dwell['seconds'] / 60:g} minutes on {task.worker.get('device_id')}...")
+        self._schedule_check(task)
+
+    def _schedule_check(self, task):
+        when = min(clock.monotonic() + WAIT_SETTINGS['dwell_check_seconds'], task.deadline)
+        self._timer.call_at(when, lambda: self._executor.submit(self._check_dwell, task))
+
+    def _check_dwell(self, task):
+        """Runs on a pool thread at each wake-up: keeps the app up, or closes it at the deadline."""
+        if clock.monotonic() < task.deadline:
+            try:
+                ensure_foreground(task.session.driver, task.result['dwell']['package'])
+            except Exception as e:
+                logging.warning(f"Foreground check failed on {task.worker.get('device_id')}: {e}")
+            self._schedule_check(task)
+            return
+        try:
+            finish_automation(task.session, task.result)
+        except Exception as e:
+            logging.error(f"Finishing dwell on {task.worker.get('device_id')} failed: {e}")
+        add_deferred_phase(task.result.get('profile'), 'dwell', task.dwell_started, time.time() - task.dwell_started)
+        self._complete(task.worker, task.started, task.result, task.results, task.on_result)
+
+    def _record(self, device_id, elapsed, result, results):
+        with self._lock:
+            self._busy_seconds[device_id] += elapsed
+            self._task_counts[device_id] += 1
+            self.running -= 1
+            self.completed += 1
+            if result is not None and results is not None:
+                results.append(result)
+            self._idle.notify_all()
+
+    def _report(self, result, on_result):
+        if result is not None and on_result:
+            on_result(result)
+        logging.info(f"Queue: {self._describe_depth()}")
+
+    def queue_depth(self):
+        """Returns the number of rows not yet handed to a device, or None if unknown."""
+        if self.total is None:
+            return None
+        return self.total - self.dispatched
+
+    def _describe_depth(self):
+        depth = self.queue_depth()
+        pending = 'unknown' if depth is None else depth
+        return f"{pending} pending, {self.running} running, {self.completed} done"
+
+    def stats(self):
+        """Returns per-device task counts and utilization since run() started."""
+        wall = (self._finished or time.monotonic()) - self._started if self._started else 0.0
+        with self._lock:
+            devices = {
+                device_id: {
+                    'tasks': self._task_counts[device_id],
+                    'busy_seconds': busy,
+                    'utilization': busy / wall if wall else 0.0,
+                }
+                for device_id, busy in self._busy_seconds.items()
+            }
+        return {
+            'wall_seconds': wall,
+            'queue_depth': self.queue_depth(),
+            'running': self.running,
+            'completed': self.completed,
+            'retired': self.retired,
+            'active': len(self._active),
+            'devices': devices,
+        }
+
+    def log_stats(self):
+        stats = self.stats()
+        logging.info(f"Scheduler: {stats['completed']} tasks in {stats['wall_seconds']:.1f}s")
+        for device_id, device in stats['devices'].items():
+            logging.info(
+                f"  {device_id}: {device['tasks']} tasks, "
+                f"{device['utilization'] * 100:.0f}% utilized"
+            )
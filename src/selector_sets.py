@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+
+"""Fallback selector lists that are raced in one polling loop instead of tried one by one."""
+
+import logging
+import threading
+from collections import Counter
+from appium.webdriver.common.appiumby import AppiumBy
+
+from src.page_snapshot import page_snapshot
+from src.waits import wait_until
+
+# Returned by click_first when the page already shows one of the done texts
+ALREADY_DONE = 'already-done'
+
+# Finds the first candidate (in priority order) with a visible, enabled match
+# and checks the page text for the done markers, all in one round trip.
+_RACE_SCRIPT = """
+var xpaths = arguments[0], doneTexts = arguments[1];
+if (doneTexts.length && document.body) {
+    var text = document.body.innerText.toLowerCase();
+    for (var d = 0; d < doneTexts.length; d++) {
+        if (text.indexOf(doneTexts[d]) !== -1) return [-1, null];
+    }
+}
+for (var i = 0; i < xpaths.length; i++) {
+    var found = document.evaluate(xpaths[i], document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+    for (var j = 0; j < found.snapshotLength; j++) {
+        var el = found.snapshotItem(j);
+        if (el.nodeType === 1 && el.getClientRects().length && !el.disabled) return [i, el];
+    }
+}
+return null;
+"""
+
+SELECTOR_SETS = []
+
+class SelectorSet:
+    """A named list of candidate xpaths for the same target, with hit counts."""
+
+    def __init__(self, name, xpaths):
+        self.name = name
+        self.xpaths = list(xpaths)
+        self.hits = Counter()
+        self.misses = 0
+        self._lock = threading.Lock()
+        SELECTOR_SETS.append(self)
+
+    def candidates(self):
+        """Returns the xpaths in their declared priority order; hit counts are only reported."""
+        return list(self.xpaths)
+
+    def union(self):
+        return ' | '.join(self.candidates())
+
+    def record(self, xpath):
+        with self._lock:
+            if xpath is None:
+                self.misses += 1
+            else:
+                self.hits[xpath] += 1
+
+def click_first(driver, selector_set, timeout=None, done_texts=()):
+    """Clicks the first candidate of the set that becomes clickable.
+
+    Returns the winning xpath, ALREADY_DONE if one of done_texts shows up on
+    the page first, or None if nothing matched before the timeout.
+    """
+    candidates = selector_set.candidates()
+    done_texts = [t.lower() for t in done_texts]
+    use_script = [True]
+
+    def race():
+        if use_script[0]:
+            try:
+                found = driver.execute_script(_RACE_SCRIPT, candidates, done_texts)
+            except Exception:
+                # Native context: no DOM to script, fall back to one union query per poll
+                use_script[0] = False
+                return None
+            if not found:
+                return None
+            index, element = found
+            if index < 0:
+                return ALREADY_DONE
+            element.click()
+            return candidates[index]
+
+        # The union only tells whether anything is clickable yet; its elements
+        # come back in document order, so the click goes by priority instead
+        if not any(element.is_displayed() and element.is_enabled()
+                   for element in driver.find_elements(AppiumBy.XPATH, selector_set.union())):
+            return None
+        for xpath in _by_priority(driver, candidates):
+            for element in driver.find_elements(AppiumBy.XPATH, xpath):
+                if element.is_displayed() and element.is_enabled():
+                    element.click()
+                    return xpath
+        return None
+
+    winner = wait_until(race, timeout)
+    if winner != ALREADY_DONE:
+        selector_set.record(winner)
+    if winner and winner != ALREADY_DONE:
+        logging.info(f"{selector_set.name}: matched {winner}")
+    return winner
+
+def _by_priority(driver, candidates):
+    """Orders the candidates for a union hit: those present in a fresh page source first.
+
+    Both groups keep the declared priority order. The local check saves a
+    find_elements round trip per absent candidate; the rest are still tried
+    in case the local XPath evaluation could not see them.
+    """
+    snapshot = page_snapshot(driver)
+    # Polling only issues read-only commands, so the cached source may predate the hit
+    snapshot.invalidate()
+    present = [xpath for xpath in candidates if snapshot.xpath(xpath)]
+    return present + [xpath for xpath in candidates if xpath not in present]
+
+def log_selector_stats():
+    """Logs hit counts per candidate so fallback lists can be reordered by hit rate."""
+    for selector_set in SELECTOR_SETS:
+        total = sum(selector_set.hits.values())
+        if not total and not selector_set.misses:
+            continue
+        logging.info(f"Selector set '{selector_set.name}': {total} hits, {selector_set.misses} misses")
+        for xpath, count in selector_set.hits.most_common():
+            logging.info(f"  {count:>5}  {xpath}")
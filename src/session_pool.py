@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+
+"""Warm Appium sessions kept per device and reused across accounts."""
+
+import logging
+import threading
+
+from src.automation_manager import get_appium_driver, CHROME_PACKAGE
+from src.profiler import count_commands
+from src.waits import wait_until
+
+NATIVE_CONTEXT = 'NATIVE_APP'
+CHROME_CONTEXTS = ('CHROMIUM', 'WEBVIEW_chrome')
+
+class DeviceSession:
+    """One UiAutomator2 session per device, switched between native and Chrome contexts."""
+
+    def __init__(self, device_id, appium_port, system_port=None, chromedriver_port=None):
+        self.device_id = device_id
+        self.appium_port = appium_port
+        self.system_port = system_port
+        self.chromedriver_port = chromedriver_port
+        self.driver = None
+        self.starts = 0
+
+    def is_alive(self):
+        if not self.driver:
+            return False
+        try:
+            self.driver.current_context
+            return True
+        except Exception:
+            return False
+
+    def ensure(self):
+        """Returns a live driver, rebuilding the session only if it is found dead."""
+        if self.is_alive():
+            return self.driver
+        if self.driver:
+            logging.warning(f"Session on {self.device_id} is dead, rebuilding")
+            self.close()
+        self.driver = get_appium_driver(self.device_id, self.appium_port, self.system_port, self.chromedriver_port)
+        if not self.driver:
+            raise RuntimeError(f"Driver init failed for {self.device_id}")
+        count_commands(self.driver)
+        self.starts += 1
+        return self.driver
+
+    def native(self):
+        driver = self.ensure()
+        if driver.current_context != NATIVE_CONTEXT:
+            driver.switch_to.context(NATIVE_CONTEXT)
+        return driver
+
+    def web(self):
+        driver = self.ensure()
+        if driver.current_context in CHROME_CONTEXTS:
+            return driver
+        driver.activate_app(CHROME_PACKAGE)
+        context = wait_until(
+            lambda: next((c for c in driver.contexts if c in CHROME_CONTEXTS), None),
+            description=f'Chrome context on {self.device_id}'
+        )
+        if not context:
+            raise RuntimeError(f"Chrome context not available on {self.device_id}")
+        driver.switch_to.context(context)
+        return driver
+
+    def close(self):
+        if self.driver:
+            try:
+                self.driver.quit()
+            except Exception:
+                pass
+            self.driver = None
+
+class SessionPool:
+    """Hands out the DeviceSession for a worker, creating it on first use."""
+
+    def __init__(self):
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def get(self, worker_config):
+        device_id = worker_config.get('device_id')
+        with self._lock:
+            session = self._sessions.get(device_id)
+            if not session:
+                session = DeviceSession(
+                    device_id, worker_config.get('appium_port'),
+                    worker_config.get('system_port'), worker_config.get('chromedriver_port'),
+                )
+                self._sessions[device_id] = session
+            return session
+
+    def discard(self, worker_config):
+        """Closes the device's session, e.g. because the device is being reset. The next get() starts a new one."""
+        with self._lock:
+            session = self._sessions.pop(worker_config.get('device_id'), None)
+        if session:
+            session.close()
+
+    def close_all(self):
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+        for session in sessions:
+            logging.info(f"Closing session on {session.device_id} ({session.starts} session starts)")
+            session.close()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+
+"""Condition-driven waits that return as soon as the device or page is ready."""
+
+import logging
+from appium.webdriver.applicationstate import ApplicationState
+
+from src import clock
+from src.profiler import record_wait
+
+# Defaults, overridable through the "waits" section of config.json
+WAIT_SETTINGS = {
+    'timeout_seconds': 15,
+    'poll_seconds': 0.25,
+    'backoff': 1.5,
+    'max_poll_seconds': 2.0,
+    'install_timeout_seconds': 300,
+    'dwell_check_seconds': 30,
+}
+
+def configure_waits(config):
+    """Applies the "waits" section of the config to the module defaults."""
+    for key, value in config.get('waits', {}).items():
+        if key in WAIT_SETTINGS:
+            WAIT_SETTINGS[key] = value
+        else:
+            logging.warning(f"Unknown wait setting ignored: {key}")
+
+def wait_until(condition, timeout=None, description=None):
+    """Polls condition() with backoff until it returns a truthy value or the timeout expires.
+
+    Returns the truthy value, or None on timeout. Exceptions raised by the
+    condition count as "not yet".
+    """
+    if timeout is None:
+        timeout = WAIT_SETTINGS['timeout_seconds']
+    poll = WAIT_SETTINGS['poll_seconds']
+    started = clock.monotonic()
+    deadline = started + timeout
+
+    try:
+        while True:
+            try:
+                value = condition()
+                if value:
+                    return value
+            except Exception:
+                pass
+
+            remaining = deadline - clock.monotonic()
+            if remaining <= 0:
+                if description:
+                    logging.warning(f"Timed out after {timeout}s waiting for {description}")
+                return None
+            clock.sleep(min(poll, remaining))
+            poll = min(poll * WAIT_SETTINGS['backoff'], WAIT_SETTINGS['max_poll_seconds'])
+    finally:
+        record_wait(clock.monotonic() - started)
+
+def wait_for_page_load(driver, timeout=None):
+    """Waits until the browser reports document.readyState == 'complete'."""
+    return bool(wait_until(
+        lambda: driver.execute_script('return document.readyState') == 'complete',
+        timeout, 'page load'
+    ))
+
+def wait_for_url_change(driver, old_url, timeout=None):
+    """Waits until the current URL differs from old_url and returns the new URL."""
+    return wait_until(
+        lambda: driver.current_url if driver.current_url != old_url else None,
+        timeout, f'navigation away from {old_url}'
+    )
+
+def wait_for_invisible(driver, by, value, timeout=None):
+    """Waits until no visible element matches the locator."""
+    def gone():
+        return not any(el.is_displayed() for el in driver.find_elements(by, value))
+    return bool(wait_until(gone, timeout, f'{value} to disappear'))
+
+def wait_for_package_installed(driver, package, timeout=None):
+    """Waits until the package is installed on the device."""
+    if timeout is None:
+        timeout = WAIT_SETTINGS['install_timeout_seconds']
+    return bool(wait_until(lambda: driver.is_app_installed(package), timeout, f'{package} install'))
+
+def wait_for_app_foreground(driver, package, timeout=None):
+    """Waits until the app is running in the foreground."""
+    return bool(wait_until(
+        lambda: driver.query_app_state(package) == ApplicationState.RUNNING_IN_FOREGROUND,
+        timeout, f'{package} in foreground'
+    ))
+
+def wait_for_activity(driver, activity, timeout=None):
+    """Waits until the given activity is in the foreground."""
+    return bool(wait_until(
+        lambda: driver.current_activity.endswith(activity),
+        timeout, f'activity {activity}'
+    ))
+
+def dwell_in_app(driver, package, seconds):
+    """Keeps the app in the foreground for the given number of seconds.
+
+    Checks the app state periodically instead of sleeping blind, and brings
+    the app back if something else took the foreground. The dwell is
+    compressed or skipped when a scaled or virtual clock is installed.
+    """
+    deadline = clock.monotonic() + clock.dwell_seconds(seconds)
+    while True:
+        remaining = deadline - clock.monotonic()
+        if remaining <= 0:
+            return
+        pause = min(WAIT_SETTINGS['dwell_check_seconds'], remaining)
+        clock.sleep(pause)
+        record_wait(pause)
+        ensure_foreground(driver, package)
+
+def ensure_foreground(driver, package):
+    """Reactivates the app if something else took the foreground."""
+    try:
+        if driver.query_app_state(package) != ApplicationState.RUNNING_IN_FOREGROUND:
+            logging.info(f"{package} left the foreground, reactivating")
+            driver.activate_app(package)
+    except Exception as e:
+        logging.warning(f"App state check failed during dwell: {e}")